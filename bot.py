@@ -17,7 +17,8 @@ from config import (
     TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, ENABLE_TELEGRAM_BOT, DEFAULT_SYMBOLS
 )
 from indicators import TechnicalIndicators
-from json_manager import JsonManager
+import indicators_kernels
+from json_manager import get_json_manager
 
 # 設定日誌
 logging.basicConfig(
@@ -32,20 +33,23 @@ class StockTradingBot:
     
     def __init__(self):
         self.indicators = TechnicalIndicators(STRATEGY_PARAMS)
-        # 從 JSON 取得監控股票清單
-        from json_manager import JsonManager
-        self.db = JsonManager()
+        # 從 JSON 取得監控股票清單（與 Telegram / 其他掃描共用同一個實例）
+        self.db = get_json_manager()
         self.symbols = self.db.get_monitor_symbols()
         
         # 取得檢查間隔
         self.check_interval = TRADING_CONFIG["check_interval_seconds"]
         
+        # 掃描中暫存的 Telegram 通知，掃描結束時一起發送
+        self._outbox = None
+        
         # 初始化 Telegram Bot（如果 ENABLE_TELEGRAM_BOT=true）
         self.bot = None
         if ENABLE_TELEGRAM_BOT and TELEGRAM_TOKEN and TELEGRAM_CHAT_ID:
             try:
                 from telegram_bot import TradingBot
                 self.bot = TradingBot(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, self.db)
+                self.bot.scanner = self  # /scan 直接使用這個實例掃描
                 logger.info("Telegram Bot 已初始化")
             except Exception as e:
                 logger.warning(f"Telegram Bot 初始化失敗: {e}")
@@ -68,6 +72,7 @@ class StockTradingBot:
     
     def get_stock_data(self, symbol, period="1mo", interval="5m"):
         """取得股票資料"""
+        requested = symbol
         try:
             from datetime import datetime, timedelta
             
@@ -118,6 +123,10 @@ class StockTradingBot:
                 df.index = df.index.tz_localize(None)
             
             logger.info(f"{symbol}: 取得 {len(df)} 筆資料")
+            
+            # 提供 Telegram /sell 使用最新價格，不必在指令中重新下載
+            if self.bot:
+                self.bot.update_price(requested, df['Close'].to_numpy()[-1].item())
             return df
             
         except Exception as e:
@@ -149,14 +158,14 @@ class StockTradingBot:
             return None
         
         current_idx = len(df_calc) - 1
-        current_price = df_calc['Close'].iloc[current_idx]
+        current_price = df_calc['Close'].to_numpy()[current_idx]
         
         # 計算停損
         stop_loss_info = indicators.calculate_stop_loss(df_calc, current_price, current_idx)
         
         # 取得 MACD 差值
-        macd_dif = df_calc['MACD_DIF'].iloc[current_idx] if 'MACD_DIF' in df_calc else df_calc['MACD'].iloc[current_idx]
-        macd_dea = df_calc['MACD_DEA'].iloc[current_idx] if 'MACD_DEA' in df_calc else df_calc['MACD_Signal'].iloc[current_idx]
+        macd_dif = float(df_calc['MACD_DIF'].to_numpy()[current_idx])
+        macd_dea = float(df_calc['MACD_DEA'].to_numpy()[current_idx])
         
         signal_data = {
             "type": "golden_cross",
@@ -188,15 +197,15 @@ class StockTradingBot:
         
         # 計算指標
         df_calc = indicators.calculate(df)
-        current = df_calc.iloc[-1]
+        current_price = df_calc['Close'].to_numpy()[-1]
         
         # ATR 硬停損
-        if stop_loss and current['Close'] <= stop_loss:
+        if stop_loss and current_price <= stop_loss:
             return {
                 "type": "hard_stop_loss",
-                "price": current['Close'],
-                "reason": f"價格 ${current['Close']:.2f} <= 停損 ${stop_loss:.2f}",
-                "pnl_pct": (current['Close'] - entry_price) / entry_price * 100 if entry_price > 0 else 0
+                "price": current_price,
+                "reason": f"價格 ${current_price:.2f} <= 停損 ${stop_loss:.2f}",
+                "pnl_pct": (current_price - entry_price) / entry_price * 100 if entry_price > 0 else 0
             }
         
         # 使用 should_sell 判斷
@@ -217,43 +226,62 @@ class StockTradingBot:
         
         return {
             "type": "sell_signal",
-            "price": current['Close'],
+            "price": current_price,
             "reason": sell_signal["reasons"],
-            "pnl_pct": (current['Close'] - entry_price) / entry_price * 100 if entry_price > 0 else 0
+            "pnl_pct": (current_price - entry_price) / entry_price * 100 if entry_price > 0 else 0
         }
     
-    def process_symbol(self, symbol):
-        """處理單一股票"""
-        # 檢查是否忽略訊號
-        if self.db.get_ignore_signals():
-            logger.debug(f"{symbol}: 忽略模式開啟，跳過處理")
-            return
-        
-        # 檢查冷卻
-        cooldown_symbols = self.db.get_cooldown_symbols()
-        for pos in cooldown_symbols:
-            if pos["symbol"] == symbol:
-                logger.debug(f"{symbol}: 在冷卻期內，跳過")
-                return
-        
+    def fetch_symbol_data(self, symbol):
+        """
+        取得股票資料與個別股票參數
+        會下載 yfinance 資料並呼叫 Dashboard API，不應在 db.batch() 中呼叫
+        Returns:
+            (df, params)，取得資料失敗時回傳 None
+        """
         # 取得股票資料
         df = self.get_stock_data(symbol)
         if df is None:
-            return
+            return None
         
         # 取得個別股票參數（如果沒有設定則使用預設值）
         symbol_params = self.db.get_symbol_params(symbol)
         if symbol_params:
             logger.info(f"{symbol}: 使用自訂參數")
-            params = symbol_params
-        else:
-            params = STRATEGY_PARAMS
+            return df, symbol_params
+        return df, STRATEGY_PARAMS
+    
+    def process_symbol(self, symbol, positions=None, cooldown=None, data=None):
+        """
+        處理單一股票
+        positions / cooldown 為掃描前一次取得的持倉對照表與冷卻股票集合，未提供時個別查詢
+        data 為 fetch_symbol_data 預先取得的 (df, params)，未提供時在此下載
+        """
+        # 檢查是否忽略訊號
+        if self.db.get_ignore_signals():
+            logger.debug(f"{symbol}: 忽略模式開啟，跳過處理")
+            return
+        
+        # 檢查冷卻
+        if cooldown is None:
+            cooldown = {pos["symbol"] for pos in self.db.get_cooldown_symbols()}
+        if symbol in cooldown:
+            logger.debug(f"{symbol}: 在冷卻期內，跳過")
+            return
+        
+        if data is None:
+            data = self.fetch_symbol_data(symbol)
+            if data is None:
+                return
+        df, params = data
         
         # 建立臨時的 TechnicalIndicators
         temp_indicators = TechnicalIndicators(params)
         
         # 取得持倉
-        position = self.db.get_position(symbol)
+        if positions is None:
+            position = self.db.get_position(symbol)
+        else:
+            position = positions.get(symbol)
         
         if position is None:
             # 檢查買入訊號
@@ -263,7 +291,7 @@ class StockTradingBot:
                 self.db.log_signal(symbol, "buy", signal)
                 
                 if self.bot:
-                    asyncio.run(self.bot.send_buy_signal(symbol, signal["price"], signal))
+                    self._notify(self.bot.format_buy_signal(symbol, signal["price"], signal))
                 
                 self.db.create_position(symbol, signal, {
                     "MACD_DIF": signal.get("macd_dif"),
@@ -284,11 +312,11 @@ class StockTradingBot:
                 
                 if self.bot:
                     if sell_signal["type"] == "hard_stop_loss":
-                        asyncio.run(self.bot.send_force_sell_notification(
+                        self._notify(self.bot.format_force_sell_notification(
                             symbol, sell_signal["price"], sell_signal["reason"]
                         ))
                     else:
-                        asyncio.run(self.bot.send_sell_signal(
+                        self._notify(self.bot.format_sell_signal(
                             symbol, sell_signal["price"],
                             sell_signal["reason"], sell_signal.get("pnl_pct")
                         ))
@@ -300,6 +328,25 @@ class StockTradingBot:
                 
                 logger.info(f"{symbol}: 賣出訊號已發送 - {sell_signal['reason']}")
     
+    def _notify(self, message):
+        """發送 Telegram 通知；掃描中先暫存，掃描結束後一起發送"""
+        if self._outbox is not None:
+            self._outbox.append(message)
+        else:
+            asyncio.run(self.bot.send_signals_batch([message]))
+    
+    def _flush_notifications(self, send=True):
+        """
+        同時發送掃描中暫存的通知
+        send=False 時不發送，回傳通知內容由呼叫端發送
+        """
+        messages, self._outbox = self._outbox, None
+        if self.bot:
+            self.bot.invalidate_position_cache()
+        if send and messages and self.bot:
+            asyncio.run(self.bot.send_signals_batch(messages))
+        return messages
+    
     def log_stock_prices(self):
         """記錄個股股價（開盤時間每5分鐘）"""
         if not self.is_trading_hours():
@@ -312,7 +359,7 @@ class StockTradingBot:
             try:
                 df = self.get_stock_data(symbol, period="1d", interval="5m")
                 if df is not None and len(df) > 0:
-                    current_price = df['Close'].iloc[-1]
+                    current_price = df['Close'].to_numpy()[-1]
                     dt = df.index[-1]
                     date_str = dt.strftime("%Y-%m-%d")
                     time_str = dt.strftime("%H:%M")
@@ -323,86 +370,155 @@ class StockTradingBot:
             except Exception as e:
                 logger.error(f"{symbol}: 股價記錄失敗 - {e}")
     
-    def run_market_scan(self):
-        """執行市場掃描"""
+    def run_market_scan(self, send_notifications=True):
+        """
+        執行市場掃描
+        send_notifications=False 時（Telegram /scan 在事件迴圈中自行發送）回傳通知內容
+        """
         if not self.is_trading_hours():
             logger.debug("非交易時間，跳過")
-            return
+            return []
         
         logger.info("開始市場掃描...")
         
         # 重新載入監控股票清單
         self.symbols = self.db.get_monitor_symbols()
         
-        for symbol in self.symbols:
-            try:
-                self.process_symbol(symbol)
-            except Exception as e:
-                logger.error(f"{symbol}: 處理失敗 - {e}")
-                self.db.log("ERROR", f"{symbol}: {e}", "market_scan")
+        # 每檔股票只處理一次
+        symbols = list(dict.fromkeys(self.symbols))
+        
+        # 先在批次外下載資料與參數：batch() 持有資料鎖，
+        # 在鎖內做網路 I/O 會讓 Telegram 指令等到整個掃描結束
+        prefetched = {}
+        if not self.db.get_ignore_signals():
+            cooldown = {pos["symbol"] for pos in self.db.get_cooldown_symbols()}
+            for symbol in symbols:
+                if symbol in cooldown:
+                    continue
+                try:
+                    data = self.fetch_symbol_data(symbol)
+                except Exception as e:
+                    logger.error(f"{symbol}: 取得資料失敗 - {e}")
+                    self.db.log("ERROR", f"{symbol}: {e}", "market_scan")
+                    continue
+                if data is not None:
+                    prefetched[symbol] = data
+        
+        # 掃描期間的持倉 / 訊號 / 日誌變更於結束時一次寫入，寫入後才發送通知
+        self._outbox = []
+        try:
+            with self.db.batch():
+                # 持倉與冷卻狀態在批次內重新取得，包含下載期間 Telegram 指令的變更
+                positions = self.db.get_positions_by_symbols(list(prefetched))
+                cooldown = {pos["symbol"] for pos in self.db.get_cooldown_symbols()}
+                for symbol, data in prefetched.items():
+                    try:
+                        self.process_symbol(symbol, positions, cooldown, data)
+                    except Exception as e:
+                        logger.error(f"{symbol}: 處理失敗 - {e}")
+                        self.db.log("ERROR", f"{symbol}: {e}", "market_scan")
+        finally:
+            messages = self._flush_notifications(send_notifications)
         
         logger.info("市場掃描完成")
+        return messages
     
-    def run_hard_stop_loss_check(self):
-        """執行硬停損檢查"""
+    def run_hard_stop_loss_check(self, send_notifications=True):
+        """
+        執行硬停損檢查
+        send_notifications=False 時（Telegram JobQueue 在事件迴圈中自行發送）回傳通知內容
+        """
         if not self.is_trading_hours():
-            return
+            return []
         
         logger.info("執行硬停損檢查...")
         
-        positions = self.db.get_all_positions(status=TradingState.HOLDING)
+        positions = self.db.get_all_positions(
+            status=TradingState.HOLDING, fields=("symbol", "holding_info.stop_loss")
+        )
         
+        # 先在批次外取得最新價格，batch() 只包住持倉更新
+        prices = {}
         for position in positions:
             symbol = position["symbol"]
-            
             try:
                 df = self.get_stock_data(symbol, period="1d", interval="1m")
-                if df is None:
-                    continue
-                
-                current_price = df.iloc[-1]['Close']
-                stop_loss = position.get("holding_info", {}).get("stop_loss", 0)
-                
-                if stop_loss and current_price <= stop_loss:
-                    logger.warning(f"{symbol}: 價格 ${current_price:.2f} <= 停損 ${stop_loss:.2f}")
-                    
-                    if self.bot:
-                        asyncio.run(self.bot.send_force_sell_notification(
-                            symbol, current_price, f"ATR 停損觸發"
-                        ))
-                    
-                    self.db.update_position_status(
-                        symbol, TradingState.SIGNAL_SELL_SENT,
-                        {
-                            "sell_signal": {
-                                "type": "hard_stop_loss",
-                                "price": current_price,
-                                "reason": "ATR 停損觸發"
-                            }
-                        }
-                    )
-            
+                if df is not None:
+                    prices[symbol] = df['Close'].to_numpy()[-1]
             except Exception as e:
                 logger.error(f"{symbol}: 停損檢查失敗 - {e}")
-    
+        
+        self._outbox = []
+        try:
+            with self.db.batch():
+                # 下載期間持倉可能已被 /sell 或 /buy 變更，重新取得仍在持有的部位
+                holding = {
+                    pos["symbol"]: pos for pos in self.db.get_all_positions(
+                        status=TradingState.HOLDING, fields=("symbol", "holding_info.stop_loss")
+                    )
+                }
+                for symbol, current_price in prices.items():
+                    position = holding.get(symbol)
+                    if position is None:
+                        continue
+                    
+                    try:
+                        stop_loss = position.get("holding_info", {}).get("stop_loss", 0)
+                        
+                        if stop_loss and current_price <= stop_loss:
+                            logger.warning(f"{symbol}: 價格 ${current_price:.2f} <= 停損 ${stop_loss:.2f}")
+                            
+                            if self.bot:
+                                self._notify(self.bot.format_force_sell_notification(
+                                    symbol, current_price, f"ATR 停損觸發"
+                                ))
+                            
+                            self.db.update_position_status(
+                                symbol, TradingState.SIGNAL_SELL_SENT,
+                                {
+                                    "sell_signal": {
+                                        "type": "hard_stop_loss",
+                                        "price": current_price,
+                                        "reason": "ATR 停損觸發"
+                                    }
+                                }
+                            )
+                    
+                    except Exception as e:
+                        logger.error(f"{symbol}: 停損檢查失敗 - {e}")
+        finally:
+            messages = self._flush_notifications(send_notifications)
+        
+        return messages
+        
     def start(self):
         """啟動機器人"""
         logger.info("啟動股票交易機器人...")
         
-        # 清除過期冷卻
+        # 預先編譯指標運算核心，避免第一次掃描時才編譯
+        indicators_kernels.warmup()
+        
+        # 清除過期冷卻（之後每次寫入持倉時會自動移除）
         self.db.clear_expired_cooldowns()
         
-        # 排程
-        schedule.every(self.check_interval).seconds.do(self.run_market_scan)
-        schedule.every(1).minutes.do(self.run_hard_stop_loss_check)
-        schedule.every(self.check_interval).seconds.do(self.log_stock_prices)  # 記錄股價
-        schedule.every().day.at("09:00").do(self.db.clear_expired_cooldowns)
+        # 日誌檔由機器人程序裁切（Dashboard 只讀取）
+        self.db.start_log_rotation()
         
         self.is_running = True
         
         # 啟動 Telegram Bot (僅當 ENABLE_TELEGRAM_BOT=true)
         if self.bot and ENABLE_TELEGRAM_BOT:
             logger.info("啟動 Telegram Bot...")
+            # bot.run() 會阻塞到結束，掃描改由 Telegram 的 JobQueue 在同一個事件迴圈中排程
+            if self.bot.schedule_jobs(self.check_interval):
+                try:
+                    self.bot.run()
+                except Exception as e:
+                    logger.error(f"Telegram Bot 運行錯誤: {e}")
+                self.is_running = False
+                logger.info("機器人已停止")
+                return
+            logger.warning("未安裝 python-telegram-bot[job-queue]，改用 schedule 排程")
             try:
                 self.bot.run()
             except Exception as e:
@@ -414,6 +530,11 @@ class StockTradingBot:
         else:
             logger.info("Telegram Bot 模式: polling 已禁用 (使用 Webhook 或單一實例)")
         
+        # 排程
+        schedule.every(self.check_interval).seconds.do(self.run_market_scan)
+        schedule.every(1).minutes.do(self.run_hard_stop_loss_check)
+        schedule.every(self.check_interval).seconds.do(self.log_stock_prices)  # 記錄股價
+        
         # 主迴圈
         while self.is_running:
             try:
@@ -9,7 +9,7 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 POSITIONS_FILE = os.path.join(DATA_DIR, "positions.json")
 TRADES_FILE = os.path.join(DATA_DIR, "trades.json")
 SIGNALS_FILE = os.path.join(DATA_DIR, "signals.json")
-LOGS_FILE = os.path.join(DATA_DIR, "logs.json")
+LOGS_FILE = os.path.join(DATA_DIR, "logs.jsonl")  # JSON Lines，只附加寫入
 CONFIG_FILE = os.path.join(DATA_DIR, "strategy_config.json")
 SYMBOLS_FILE = os.path.join(DATA_DIR, "monitor_symbols.json")
 SYMBOL_PARAMS_FILE = os.path.join(DATA_DIR, "symbol_params.json")
@@ -21,6 +21,13 @@ os.makedirs(DATA_DIR, exist_ok=True)
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
 
+# 設定公開網址時改用 webhook 接收更新；未設定（本機開發）則使用 polling
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")  # 例：https://your-app.up.railway.app
+TELEGRAM_WEBHOOK_PORT = int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443"))
+# Telegram 推送時附在 X-Telegram-Bot-Api-Secret-Token 標頭，不符的請求一律拒絕
+# 只能使用 A-Z a-z 0-9 _ -；未設定時每次啟動隨機產生（run_webhook 會重新註冊）
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+
 # ============ Dashboard API 配置 ============
 DASHBOARD_URL = os.getenv("DASHBOARD_URL", "https://stock-trading-bot-production.up.railway.app")
 
@@ -1,21 +1,73 @@
 """
 Web Dashboard - Flask 伺服器（完整版）
 """
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context
 from flask_cors import CORS
+from flask_compress import Compress
 import sys
 import os
 import json
+import math
+import time
+import threading
+import multiprocessing
+import urllib.parse
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 重量級相依套件於啟動時載入，避免第一個請求承擔匯入延遲
+import yfinance as yf
+from ta.momentum import RSIIndicator
+from ta.trend import MACD, ADXIndicator
+from ta.volatility import AverageTrueRange
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from json_manager import JsonManager
+from json_manager import get_json_manager
 from config import STRATEGY_PARAMS, TRADING_CONFIG, DEFAULT_SYMBOLS
+from backtest import run_backtest_with_params
 
 app = Flask(__name__)
 CORS(app)  # 允許跨域請求
 
-db = JsonManager()
+# 壓縮回應（K 線 / 回測 JSON 重複鍵名多，壓縮率高）
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html', 'text/javascript']
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+Compress(app)
+
+db = get_json_manager()
+
+# ============ 股價資料快取 ============
+
+# yfinance 內部已共用單一 HTTP session（不支援 requests_cache），
+# 這裡在其上加一層短時間的記憶體快取，避免重複下載相同資料
+HISTORY_CACHE_TTL = 60  # 秒
+_history_cache = {}
+_history_lock = threading.Lock()
+
+
+def fetch_history(symbol, period, interval):
+    """
+    取得股價歷史資料（帶快取）
+    回傳的 DataFrame 為共用物件，呼叫端修改前需自行 copy()
+    """
+    key = (symbol, period, interval)
+    now = time.monotonic()
+    with _history_lock:
+        cached = _history_cache.get(key)
+        if cached and now - cached[0] < HISTORY_CACHE_TTL:
+            return cached[1]
+    
+    df = yf.Ticker(symbol).history(period=period, interval=interval)
+    
+    with _history_lock:
+        # 順便清除過期項目，避免快取無限成長
+        for k in [k for k, v in _history_cache.items() if now - v[0] >= HISTORY_CACHE_TTL]:
+            del _history_cache[k]
+        _history_cache[key] = (now, df)
+    return df
 
 
 # ============ 即時監控頁 ============
@@ -66,7 +118,6 @@ def api_logs():
 
 def safe_round(val, decimals=2):
     """安全四捨五入，處理 NaN"""
-    import math
     try:
         if val is None or (isinstance(val, float) and math.isnan(val)):
             return None
@@ -75,12 +126,6 @@ def safe_round(val, decimals=2):
         return None
 @app.route('/api/live_chart/<symbol>')
 def api_live_chart(symbol):
-    import yfinance as yf
-    from ta.momentum import RSIIndicator
-    from ta.trend import MACD, ADXIndicator
-    from ta.volatility import AverageTrueRange
-    from datetime import datetime, timedelta
-    
     try:
         # 嘗試多個 symbol 格式
         symbols_to_try = [
@@ -113,7 +158,7 @@ def api_live_chart(symbol):
         
         # 如果下載失敗，回退到舊方法
         if df is None or len(df) < 10:
-            df = yf.Ticker(symbol).history(period="5d", interval="5m")
+            df = fetch_history(symbol, "5d", "5m").copy()
         
         if df is None or len(df) < 10:
             return jsonify({"error": "無法取得資料"})
@@ -165,7 +210,7 @@ def api_live_chart(symbol):
             }
             candles.append(candle)
         
-        signals = db.get_signals(symbol=symbol, limit=20)
+        signals = db.get_signals(symbol=symbol, limit=20, fields=("signal_type",))
         
         return jsonify({
             "symbol": symbol,
@@ -196,9 +241,7 @@ def api_add_symbol():
         return jsonify({"success": False, "error": "請輸入股票代碼"})
     
     try:
-        import yfinance as yf
-        stock = yf.Ticker(symbol)
-        hist = stock.history(period="1mo", interval="1d")
+        hist = fetch_history(symbol, "1mo", "1d")
         if hist is None or len(hist) < 5:
             return jsonify({"success": False, "error": f"無法取得 {symbol} 的資料"})
     except Exception as e:
@@ -218,6 +261,90 @@ def api_remove_symbol():
     return jsonify({"success": success})
 
 
+# ============ 表單解析 ============
+
+def parse_params_form(form, defaults=None):
+    """
+    將策略參數表單轉換為參數字典
+    Args:
+        form: request.form
+        defaults: 欄位空白或格式錯誤時使用的預設參數
+    Returns:
+        dict: 與 STRATEGY_PARAMS 相同結構的參數
+    """
+    defaults = defaults or STRATEGY_PARAMS
+    values = form.to_dict()
+    
+    def get_num(key, default, cast=int):
+        val = values.get(key)
+        if not val:
+            return default
+        try:
+            return cast(val)
+        except ValueError:
+            return default
+    
+    return {
+        "macd": {
+            "fast": get_num('macd_fast', defaults["macd"]["fast"]),
+            "slow": get_num('macd_slow', defaults["macd"]["slow"]),
+            "signal": get_num('macd_signal', defaults["macd"]["signal"])
+        },
+        "rsi": {
+            "period": get_num('rsi_period', defaults["rsi"]["period"]),
+            "oversold": get_num('rsi_oversold', defaults["rsi"]["oversold"]),
+            "overbought": get_num('rsi_overbought', defaults["rsi"]["overbought"])
+        },
+        "adx": {
+            "period": get_num('adx_period', defaults["adx"]["period"]),
+            "threshold": get_num('adx_threshold', defaults["adx"]["threshold"])
+        },
+        "atr": {
+            "period": get_num('atr_period', defaults["atr"]["period"])
+        },
+        "confirm_bars": get_num('confirm_bars', defaults.get("confirm_bars", 3)),
+        "stop_loss_multiplier": get_num('stop_loss_multiplier', defaults.get("stop_loss_multiplier", 2.0), float),
+        "new_high_period": get_num('new_high_period', defaults.get("new_high_period", 252))
+    }
+
+
+def params_key(params):
+    """產生參數的穩定鍵值（作為回測結果快取鍵）"""
+    return json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+
+def backtest_cache_key(period, interval, initial_capital, params):
+    """回測結果快取鍵"""
+    return f"{period}|{interval}|{initial_capital}|{params_key(params)}"
+
+
+# ============ 回測結果快取 ============
+
+# 回測結果僅存於內存（Railway filesystem 唯讀），請求執行緒與背景排程共用，以鎖保護
+BACKTEST_CACHE_TTL = 3600  # 秒
+_backtest_cache = {}
+_backtest_lock = threading.Lock()
+
+
+def get_backtest_cache(symbol, cache_key):
+    """取得回測結果快取，超過 BACKTEST_CACHE_TTL 秒視為過期"""
+    with _backtest_lock:
+        cached = _backtest_cache.get((symbol.upper(), cache_key))
+    if cached and time.monotonic() - cached[0] < BACKTEST_CACHE_TTL:
+        return cached[1]
+    return None
+
+
+def save_backtest_cache(symbol, cache_key, result):
+    """儲存回測結果快取"""
+    now = time.monotonic()
+    with _backtest_lock:
+        # 順便清除過期項目，避免快取無限成長
+        for k in [k for k, v in _backtest_cache.items() if now - v[0] >= BACKTEST_CACHE_TTL]:
+            del _backtest_cache[k]
+        _backtest_cache[(symbol.upper(), cache_key)] = (now, result)
+
+
 # ============ 策略配置頁 ============
 
 @app.route('/config')
@@ -258,42 +385,7 @@ def config_symbol_save(symbol):
         symbol = symbol.upper()
         
         # 解析表單參數
-        def get_int(key, default):
-            val = request.form.get(key)
-            try:
-                return int(val) if val else default
-            except:
-                return default
-        
-        def get_float(key, default):
-            val = request.form.get(key)
-            try:
-                return float(val) if val else default
-            except:
-                return default
-        
-        params = {
-            "macd": {
-                "fast": get_int('macd_fast', 12),
-                "slow": get_int('macd_slow', 26),
-                "signal": get_int('macd_signal', 9)
-            },
-            "rsi": {
-                "period": get_int('rsi_period', 14),
-                "oversold": get_int('rsi_oversold', 30),
-                "overbought": get_int('rsi_overbought', 70)
-            },
-            "adx": {
-                "period": get_int('adx_period', 14),
-                "threshold": get_int('adx_threshold', 20)
-            },
-            "atr": {
-                "period": get_int('atr_period', 14)
-            },
-            "confirm_bars": get_int('confirm_bars', 3),
-            "stop_loss_multiplier": get_float('stop_loss_multiplier', 2.0),
-            "new_high_period": get_int('new_high_period', 252)
-        }
+        params = parse_params_form(request.form)
         
         # 儲存參數
         success = db.save_symbol_params(symbol, params)
@@ -307,7 +399,6 @@ def config_symbol_save(symbol):
             success=success
         )
     except Exception as e:
-        import traceback
         print("儲存參數錯誤:", traceback.format_exc())
         return render_template('error.html', error=f"儲存參數失敗：{str(e)}"), 500
 
@@ -376,33 +467,12 @@ def backtest():
         
         # 如果有override參數，使用表單中的值
         if 'override' in request.form:
-            params = {
-                "macd": {
-                    "fast": int(request.form.get('macd_fast', 8)),
-                    "slow": int(request.form.get('macd_slow', 20)),
-                    "signal": int(request.form.get('macd_signal', 9))
-                },
-                "rsi": {
-                    "period": int(request.form.get('rsi_period', 14)),
-                    "oversold": int(request.form.get('rsi_oversold', 30)),
-                    "overbought": int(request.form.get('rsi_overbought', 70))
-                },
-                "adx": {
-                    "period": int(request.form.get('adx_period', 14)),
-                    "threshold": int(request.form.get('adx_threshold', 20))
-                },
-                "atr": {
-                    "period": int(request.form.get('atr_period', 14))
-                },
-                "confirm_bars": int(request.form.get('confirm_bars', 3)),
-                "stop_loss_multiplier": float(request.form.get('stop_loss_multiplier', 2.0))
-            }
+            params = parse_params_form(request.form)
             
             # 儲存為該股票的個別策略
             db.save_symbol_params(symbol, params)
         
         # 將使用的參數序列化為 URL 參數
-        import urllib.parse
         params_json = urllib.parse.quote(json.dumps(params))
         
         return redirect(url_for('backtest_result', 
@@ -433,14 +503,19 @@ def backtest_result():
         return redirect(url_for('backtest'))
     
     try:
-        # 如果 URL 有傳遞參數，直接使用
+        # 如果 URL 有傳遞參數，直接使用；否則使用預設參數
         if params_data:
-            import urllib.parse
             params = json.loads(urllib.parse.unquote(params_data))
-            result = run_backtest(symbol, period, interval, initial_capital, params)
         else:
-            # 否則執行回測（使用預設參數）
-            result = run_backtest(symbol, period, interval, initial_capital)
+            params = STRATEGY_PARAMS
+        
+        # 先查快取（背景排程會預先計算監控股票的預設參數回測）
+        cache_key = backtest_cache_key(period, interval, initial_capital, params)
+        result = get_backtest_cache(symbol, cache_key)
+        if result is None:
+            result = run_backtest(symbol, period, interval, initial_capital, params)
+            if "error" not in result:
+                save_backtest_cache(symbol, cache_key, result)
     except Exception as e:
         result = {"error": f"回測發生錯誤：{str(e)}"}
     
@@ -482,37 +557,66 @@ def api_optimize():
         return jsonify({"success": False, "error": f"優化過程發生錯誤：{str(e)}"})
 
 
-def optimize_params(symbol, period, interval, initial_capital, target_win_rate):
-    """網格搜索找出符合目標勝率的最佳參數"""
-    import yfinance as yf
-    from ta.momentum import RSIIndicator
-    from ta.trend import MACD, ADXIndicator
-    from ta.volatility import AverageTrueRange
+@app.route('/api/optimize/stream')
+def api_optimize_stream():
+    """參數優化器（Server-Sent Events 逐步回報進度）"""
+    symbol = request.args.get('symbol')
+    target_win_rate = float(request.args.get('target_win_rate', 60))
+    period = request.args.get('period', '1y')
+    interval = request.args.get('interval', '1d')
+    initial_capital = int(request.args.get('initial_capital', 100000))
     
-    # 取得股價資料
-    try:
-        df = yf.Ticker(symbol).history(period=period, interval=interval)
-        if df is None or len(df) < 50:
-            return {"error": f"無法取得 {symbol} 的股價資料或資料不足 (取得 {len(df) if df is not None else 0} 筆)"}
-    except Exception as e:
-        return {"error": f"取得股價資料失敗：{str(e)}"}
-    
-    # 參數網格
-    param_grid = {
-        "macd_fast": [8, 12, 16],
-        "macd_slow": [20, 26, 32],
-        "macd_signal": [6, 9, 12],
-        "rsi_period": [7, 14, 21],
-        "confirm_bars": [1, 2, 3, 5],
-        "stop_loss_multiplier": [1.5, 2.0, 2.5]
-    }
+    def sse(event):
+        return f"data: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
     
-    best_result = None
-    best_score = -999
-    total_combinations = 0
-    valid_combinations = 0
+    def generate():
+        if not symbol:
+            yield sse({"type": "error", "error": "請輸入股票代碼"})
+            return
+        try:
+            for event in iter_optimize_params(symbol, period, interval, initial_capital, target_win_rate):
+                yield sse(event)
+        except Exception as e:
+            yield sse({"type": "error", "error": f"優化過程發生錯誤：{str(e)}"})
     
-    # 遍歷所有參數組合
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# 參數網格
+OPTIMIZE_PARAM_GRID = {
+    "macd_fast": [8, 12, 16],
+    "macd_slow": [20, 26, 32],
+    "macd_signal": [6, 9, 12],
+    "rsi_period": [7, 14, 21],
+    "confirm_bars": [1, 2, 3, 5],
+    "stop_loss_multiplier": [1.5, 2.0, 2.5]
+}
+
+# 優化器使用的程序池（首次使用時建立，跨請求共用）
+# 使用 spawn 避免在多執行緒的 Flask 程序中 fork；
+# 工作函式放在 backtest.py，由 run.py 啟動時子程序不會重新執行這個檔案的初始化
+OPTIMIZER_MAX_WORKERS = 4
+_optimizer_executor = None
+_optimizer_executor_lock = threading.Lock()
+
+
+def get_optimizer_executor():
+    global _optimizer_executor
+    with _optimizer_executor_lock:
+        if _optimizer_executor is None:
+            _optimizer_executor = ProcessPoolExecutor(
+                max_workers=min(OPTIMIZER_MAX_WORKERS, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _optimizer_executor
+
+
+def iter_param_combinations(param_grid=OPTIMIZE_PARAM_GRID):
+    """產生所有有效的參數組合"""
     for macd_fast in param_grid["macd_fast"]:
         for macd_slow in param_grid["macd_slow"]:
             if macd_fast >= macd_slow:
@@ -521,10 +625,7 @@ def optimize_params(symbol, period, interval, initial_capital, target_win_rate):
                 for rsi_period in param_grid["rsi_period"]:
                     for confirm in param_grid["confirm_bars"]:
                         for sl_mult in param_grid["stop_loss_multiplier"]:
-                            
-                            total_combinations += 1
-                            
-                            params = {
+                            yield {
                                 "macd": {"fast": macd_fast, "slow": macd_slow, "signal": signal},
                                 "rsi": {"period": rsi_period, "oversold": 30, "overbought": 70},
                                 "adx": {"period": 14, "threshold": 20},
@@ -532,30 +633,82 @@ def optimize_params(symbol, period, interval, initial_capital, target_win_rate):
                                 "confirm_bars": confirm,
                                 "stop_loss_multiplier": sl_mult
                             }
-                            
-                            try:
-                                result = run_backtest_with_params(df, params, initial_capital)
-                                
-                                if "error" in result:
-                                    continue
-                                
-                                valid_combinations += 1
-                                
-                                # 計算分數：接近目標勝率且報酬率越高越好
-                                win_rate_diff = abs(result["win_rate"] - target_win_rate)
-                                score = -win_rate_diff * 100 + result["total_return"] * 0.1
-                                
-                                if score > best_score:
-                                    best_score = score
-                                    best_result = result
-                                    
-                            except Exception as e:
-                                continue
+
+
+def iter_optimize_params(symbol, period, interval, initial_capital, target_win_rate):
+    """
+    網格搜索找出符合目標勝率的最佳參數（逐步回報進度）
+    每個參數組合在程序池中執行
+    Yields:
+        dict: {"type": "progress", ...} 進度，最後為 {"type": "result", ...} 或 {"type": "error", ...}
+    """
+    # 取得股價資料
+    try:
+        df = fetch_history(symbol, period, interval)
+        if df is None or len(df) < 50:
+            yield {"type": "error", "error": f"無法取得 {symbol} 的股價資料或資料不足 (取得 {len(df) if df is not None else 0} 筆)"}
+            return
+    except Exception as e:
+        yield {"type": "error", "error": f"取得股價資料失敗：{str(e)}"}
+        return
+    
+    combinations = list(iter_param_combinations())
+    total_combinations = len(combinations)
+    
+    executor = get_optimizer_executor()
+    futures = {
+        executor.submit(run_backtest_with_params, df, params, initial_capital): idx
+        for idx, params in enumerate(combinations)
+    }
+    
+    best_result = None
+    best_score = -999
+    best_idx = None
+    done = 0
+    valid_combinations = 0
+    
+    try:
+        for future in as_completed(futures):
+            done += 1
+            idx = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                result = {"error": "執行失敗"}
+            
+            if "error" not in result:
+                valid_combinations += 1
+                
+                # 計算分數：接近目標勝率且報酬率越高越好
+                win_rate_diff = abs(result["win_rate"] - target_win_rate)
+                score = -win_rate_diff * 100 + result["total_return"] * 0.1
+                
+                # 同分時取網格順序較前者，結果與完成順序無關
+                if score > best_score or (score == best_score and best_idx is not None and idx < best_idx):
+                    best_score = score
+                    best_result = result
+                    best_idx = idx
+            
+            yield {
+                "type": "progress",
+                "done": done,
+                "total": total_combinations,
+                "best": {
+                    "win_rate": best_result["win_rate"],
+                    "total_return": best_result["total_return"]
+                } if best_result else None
+            }
+    finally:
+        # 客戶端中斷時取消尚未執行的組合
+        for future in futures:
+            future.cancel()
     
     if best_result is None:
-        return {"error": f"找不到符合條件的參數組合 (已測試 {total_combinations} 組，其中 {valid_combinations} 組有效)"}
+        yield {"type": "error", "error": f"找不到符合條件的參數組合 (已測試 {total_combinations} 組，其中 {valid_combinations} 組有效)"}
+        return
     
-    return {
+    yield {
+        "type": "result",
         "symbol": symbol,
         "target_win_rate": target_win_rate,
         "recommended_params": best_result["params"],
@@ -563,241 +716,19 @@ def optimize_params(symbol, period, interval, initial_capital, target_win_rate):
     }
 
 
-def run_backtest_with_params(df, params, initial_capital=100000):
-    """使用指定參數執行回測"""
-    from ta.momentum import RSIIndicator
-    from ta.trend import MACD, ADXIndicator
-    from ta.volatility import AverageTrueRange
+def optimize_params(symbol, period, interval, initial_capital, target_win_rate):
+    """網格搜索找出符合目標勝率的最佳參數"""
+    event = {}
+    for event in iter_optimize_params(symbol, period, interval, initial_capital, target_win_rate):
+        pass
     
-    try:
-        # 複製資料避免修改原始資料
-        df = df.copy()
-        
-        # 記錄股價資料（用於圖表）- 從 start_idx 開始，與 equityCurve 對齊
-        price_data = []
-        start_idx = 30
-        for i in range(start_idx, len(df)):
-            price_data.append({
-                "time": str(df.index[i].date()),
-                "open": float(round(float(df['Open'].iloc[i]), 2)),
-                "high": float(round(float(df['High'].iloc[i]), 2)),
-                "low": float(round(float(df['Low'].iloc[i]), 2)),
-                "close": float(round(float(df['Close'].iloc[i]), 2))
-            })
-        
-        # 計算 MACD
-        macd = MACD(df['Close'], 
-                     window_slow=params["macd"]["slow"],
-                     window_fast=params["macd"]["fast"], 
-                     window_sign=params["macd"]["signal"])
-        df['MACD'] = macd.macd().fillna(0)  # NaN 填為 0
-        df['MACD_Signal'] = macd.macd_signal().fillna(0)
-        df['MACD_Hist'] = macd.macd_diff().fillna(0)
-        
-        df['RSI'] = RSIIndicator(df['Close'], window=params["rsi"]["period"]).rsi().fillna(50)
-        
-        # ADX 指標計算
-        try:
-            adx_indicator = ADXIndicator(df['High'], df['Low'], df['Close'], window=params["adx"]["period"])
-            df['ADX'] = adx_indicator.adx().fillna(20)
-            df['ADX'] = df['ADX'].clip(lower=0, upper=100)  # ADX 範圍 0-100
-        except:
-            df['ADX'] = 20
-        
-        atr = AverageTrueRange(df['High'], df['Low'], df['Close'], window=params["atr"]["period"])
-        df['ATR'] = atr.average_true_range().fillna(df['Close'].mean() * 0.02)
-        
-        # 買賣訊號
-        df['GC'] = (df['MACD'] > df['MACD_Signal']) & (df['MACD'].shift(1) <= df['MACD_Signal'].shift(1))
-        df['DC'] = (df['MACD'] < df['MACD_Signal']) & (df['MACD'].shift(1) >= df['MACD_Signal'].shift(1))
-        
-        confirm_bars = params.get("confirm_bars", 3)
-        gc_confirm = [False] * len(df)
-        
-        for i in range(confirm_bars + 1, len(df)):
-            if df['GC'].iloc[i - confirm_bars]:
-                all_above = True
-                for j in range(i - confirm_bars + 1, i + 1):
-                    if df['MACD'].iloc[j] <= df['MACD_Signal'].iloc[j]:
-                        all_above = False
-                        break
-                gc_confirm[i] = all_above
-        
-        df['GC_Confirm'] = gc_confirm
-        
-        # 執行回測
-        initial_capital_float = float(initial_capital)
-        cash = initial_capital_float  # 現金
-        shares = 0  # 股數
-        position = 0  # 是否持有部位
-        entry_price = 0  # 買入價格
-        entry_date = None  # 買入日期
-        trades = []
-        equity_curve = []  # 資金曲線（總資產 = 現金 + 股票價值）
-        buy_signals = []  # 買入點
-        sell_signals = []  # 賣出點
-        macd_data = []  # MACD 數據
-        rsi_data = []  # RSI 數據
-        adx_data = []  # ADX 數據
-        
-        # 固定倉位比例（50%）
-        position_size = 1.0
-        
-        # 從有足夠歷史資料的地方開始
-        start_idx = 30  # 避開前面需要計算指標的資料
-        
-        for i in range(start_idx, len(df)):
-            current_price = float(df['Close'].iloc[i])
-            current_time = str(df.index[i].date())
-            
-            # 記錄技術指標
-            macd_data.append({
-                "time": current_time,
-                "macd": round(float(df['MACD'].iloc[i]), 4),
-                "signal": round(float(df['MACD_Signal'].iloc[i]), 4),
-                "hist": round(float(df['MACD_Hist'].iloc[i]), 4)
-            })
-            rsi_data.append({
-                "time": current_time,
-                "rsi": round(float(df['RSI'].iloc[i]), 2)
-            })
-            adx_data.append({
-                "time": current_time,
-                "adx": round(float(df['ADX'].iloc[i]), 2)
-            })
-            
-            # 計算總資產（現金 + 股票價值）
-            if position:
-                current_equity = cash + shares * current_price
-            else:
-                current_equity = cash
-            
-            # 記錄為相對於初始資金的比例 (%)
-            equity_pct = (current_equity - initial_capital_float) / initial_capital_float * 100
-            equity_curve.append({
-                "time": current_time,
-                "equity": round(current_equity, 2),
-                "equity_pct": round(equity_pct, 2)
-            })
-            
-            # 買入訊號
-            if df.iloc[i]['GC_Confirm'] and position == 0:
-                # 用當時的全部資金買入
-                if current_price > 0:
-                    shares = int(cash // current_price)
-                    cost = shares * current_price
-                    cash = cash - cost  # 剩下的是現金
-                entry_price = current_price
-                entry_date = df.index[i]
-                position = 1
-                
-                # 記錄買入點
-                buy_signals.append({
-                    "time": current_time,
-                    "price": float(round(entry_price, 2)),
-                    "index": i - start_idx  # 改為相對於 price_data 的索引
-                })
-                
-            # 賣出訊號
-            elif df.iloc[i]['DC'] and position == 1:
-                exit_price = current_price
-                exit_date = df.index[i]
-                
-                # 計算此筆交易的報酬率
-                pnl_pct = (exit_price - entry_price) / entry_price * 100
-                is_win = pnl_pct > 0
-                
-                trades.append({
-                    "id": len(trades) + 1,
-                    "entry_date": str(entry_date.date()),
-                    "exit_date": current_time,
-                    "entry_price": float(round(entry_price, 2)),
-                    "exit_price": float(round(exit_price, 2)),
-                    "pnl": float(round(pnl_pct, 2)),
-                    "win": bool(is_win)
-                })
-                
-                # 記錄賣出點
-                sell_signals.append({
-                    "time": current_time,
-                    "price": float(round(exit_price, 2)),
-                    "index": i - start_idx,  # 改為相對於 price_data 的索引
-                    "pnl": float(round(pnl_pct, 2))
-                })
-                
-                # 賣出股票，回收全部資金
-                cash = cash + shares * exit_price
-                shares = 0
-                position = 0
-        
-        # 統計
-        total = len(trades)
-        winning = [t for t in trades if t.get("win") is True or t.get("win") == "true"]
-        win_rate = len(winning) / total * 100 if total > 0 else 0
-        
-        # 計算總報酬率（基於最後一天的 equity_pct）
-        final_equity_pct = 0
-        if equity_curve:
-            final_equity_pct = equity_curve[-1].get("equity_pct", 0)
-        
-        # 計算回撤曲線（基於 equity_pct）
-        drawdown = []
-        if equity_curve and len(equity_curve) > 0:
-            peak_pct = 0  # 峰值%（從0開始）
-            current_dd = 0  # 當前回撤%
-            
-            for item in equity_curve:
-                equity_pct = item.get("equity_pct", 0)
-                
-                # 更新峰值
-                if equity_pct >= peak_pct:
-                    peak_pct = equity_pct
-                    current_dd = 0  # 回到高點，回撤歸零
-                elif equity_pct < peak_pct:
-                    # 計算新回撤
-                    current_dd = peak_pct - equity_pct
-                
-                drawdown.append({
-                    "time": item["time"],
-                    "drawdown": round(current_dd, 2)
-                })
-        
-        max_dd = 0
-        if drawdown:
-            max_dd = max([d["drawdown"] for d in drawdown])
-        
-        return {
-            "total_trades": total,
-            "wins": len(winning),
-            "losses": total - len(winning),
-            "win_rate": round(win_rate, 2),
-            "total_return": round(final_equity_pct, 2),
-            "trades": trades,
-            "equity_curve": equity_curve,
-            "buy_signals": buy_signals,
-            "sell_signals": sell_signals,
-            "price_data": price_data,
-            "drawdown": drawdown,
-            "macd_data": macd_data,
-            "rsi_data": rsi_data,
-            "adx_data": adx_data,
-            "max_drawdown": round(max_dd, 2),
-            "final_capital": round(equity_curve[-1]["equity"], 2) if equity_curve else round(initial_capital_float, 2),
-            "params": params
-        }
-        
-    except Exception as e:
-        import traceback
-        return {"error": f"{str(e)}\n{traceback.format_exc()}"}
+    if event.get("type") == "error":
+        return {"error": event["error"]}
+    return {k: v for k, v in event.items() if k != "type"}
 
 
 def run_backtest(symbol, period, interval, initial_capital=100000, params_override=None):
     """執行回測（使用儲存的參數或指定的參數）"""
-    import yfinance as yf
-    from ta.momentum import RSIIndicator
-    from ta.trend import MACD, ADXIndicator
-    from ta.volatility import AverageTrueRange
-    
     # 如果有指定參數則使用，否則使用預設參數
     if params_override:
         params = params_override
@@ -805,7 +736,7 @@ def run_backtest(symbol, period, interval, initial_capital=100000, params_overri
         params = STRATEGY_PARAMS
     
     try:
-        df = yf.Ticker(symbol).history(period=period, interval=interval)
+        df = fetch_history(symbol, period, interval)
     except Exception as e:
         return {"error": f"無法取得股價資料：{str(e)}"}
     
@@ -820,6 +751,47 @@ def run_backtest(symbol, period, interval, initial_capital=100000, params_overri
     return result
 
 
+# ============ 背景預先計算回測 ============
+
+BACKTEST_REFRESH_SECONDS = 3600  # 秒
+# 與回測頁表單預設值一致
+DEFAULT_BACKTEST_PERIOD = '6mo'
+DEFAULT_BACKTEST_INTERVAL = '1d'
+DEFAULT_BACKTEST_CAPITAL = 100000
+
+
+def refresh_all_backtests():
+    """以預設參數預先計算所有監控股票的回測結果"""
+    cache_key = backtest_cache_key(DEFAULT_BACKTEST_PERIOD, DEFAULT_BACKTEST_INTERVAL,
+                                   DEFAULT_BACKTEST_CAPITAL, STRATEGY_PARAMS)
+    
+    for symbol in db.get_monitor_symbols():
+        try:
+            result = run_backtest(symbol, DEFAULT_BACKTEST_PERIOD, DEFAULT_BACKTEST_INTERVAL,
+                                  DEFAULT_BACKTEST_CAPITAL, STRATEGY_PARAMS)
+            if "error" not in result:
+                save_backtest_cache(symbol, cache_key, result)
+        except Exception as e:
+            print(f"預先計算 {symbol} 回測失敗: {e}")
+
+
+def _backtest_refresh_loop():
+    while True:
+        # 任何錯誤（例如取得監控清單失敗）都不能結束 daemon thread，否則要到重啟才恢復排程
+        try:
+            refresh_all_backtests()
+        except Exception:
+            print("背景回測排程失敗:", traceback.format_exc())
+        time.sleep(BACKTEST_REFRESH_SECONDS)
+
+
+def start_backtest_scheduler():
+    """啟動背景回測排程（daemon thread，隨主程式結束）"""
+    thread = threading.Thread(target=_backtest_refresh_loop, name="backtest-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
 # ============ 錯誤處理 ============
 
 @app.errorhandler(404)
@@ -829,11 +801,16 @@ def not_found(e):
 
 @app.errorhandler(500)
 def server_error(e):
-    import traceback
     print("500錯誤:", traceback.format_exc())
     return render_template('error.html', error="500 - 伺服器錯誤\n" + str(e)), 500
 
 
-if __name__ == '__main__':
+def main():
+    """啟動背景回測排程與 Flask 伺服器"""
     port = int(os.environ.get('PORT', 5000))
+    start_backtest_scheduler()
     app.run(host='0.0.0.0', port=port, debug=False)
+
+
+if __name__ == '__main__':
+    main()
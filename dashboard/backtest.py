@@ -0,0 +1,245 @@
+"""
+回測運算（優化器程序池的工作函式）
+只匯入回測需要的套件、不建立 Flask app 或 JsonManager，spawn 子程序匯入時沒有副作用
+"""
+import sys
+import os
+import traceback
+
+from ta.momentum import RSIIndicator
+from ta.trend import MACD, ADXIndicator
+from ta.volatility import AverageTrueRange
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import STRATEGY_PARAMS
+
+
+def run_backtest_with_params(df, params, initial_capital=100000):
+    """使用指定參數執行回測"""
+    try:
+        # 複製資料避免修改原始資料
+        df = df.copy()
+        
+        # 記錄股價資料（用於圖表）- 從 start_idx 開始，與 equityCurve 對齊
+        price_data = []
+        start_idx = 30
+        for i in range(start_idx, len(df)):
+            price_data.append({
+                "time": str(df.index[i].date()),
+                "open": float(round(float(df['Open'].iloc[i]), 2)),
+                "high": float(round(float(df['High'].iloc[i]), 2)),
+                "low": float(round(float(df['Low'].iloc[i]), 2)),
+                "close": float(round(float(df['Close'].iloc[i]), 2))
+            })
+        
+        # 計算 MACD
+        macd = MACD(df['Close'], 
+                     window_slow=params["macd"]["slow"],
+                     window_fast=params["macd"]["fast"], 
+                     window_sign=params["macd"]["signal"])
+        df['MACD'] = macd.macd().fillna(0)  # NaN 填為 0
+        df['MACD_Signal'] = macd.macd_signal().fillna(0)
+        df['MACD_Hist'] = macd.macd_diff().fillna(0)
+        
+        df['RSI'] = RSIIndicator(df['Close'], window=params["rsi"]["period"]).rsi().fillna(50)
+        
+        # ADX 指標計算
+        try:
+            adx_indicator = ADXIndicator(df['High'], df['Low'], df['Close'], window=params["adx"]["period"])
+            df['ADX'] = adx_indicator.adx().fillna(20)
+            df['ADX'] = df['ADX'].clip(lower=0, upper=100)  # ADX 範圍 0-100
+        except:
+            df['ADX'] = 20
+        
+        atr = AverageTrueRange(df['High'], df['Low'], df['Close'], window=params["atr"]["period"])
+        df['ATR'] = atr.average_true_range().fillna(df['Close'].mean() * 0.02)
+        
+        # 買賣訊號
+        df['GC'] = (df['MACD'] > df['MACD_Signal']) & (df['MACD'].shift(1) <= df['MACD_Signal'].shift(1))
+        df['DC'] = (df['MACD'] < df['MACD_Signal']) & (df['MACD'].shift(1) >= df['MACD_Signal'].shift(1))
+        
+        confirm_bars = params.get("confirm_bars", 3)
+        gc_confirm = [False] * len(df)
+        
+        for i in range(confirm_bars + 1, len(df)):
+            if df['GC'].iloc[i - confirm_bars]:
+                all_above = True
+                for j in range(i - confirm_bars + 1, i + 1):
+                    if df['MACD'].iloc[j] <= df['MACD_Signal'].iloc[j]:
+                        all_above = False
+                        break
+                gc_confirm[i] = all_above
+        
+        df['GC_Confirm'] = gc_confirm
+        
+        # ATR 停損倍數（與實盤的 ATR 硬停損一致）
+        sl_mult = params.get("stop_loss_multiplier", STRATEGY_PARAMS["stop_loss_multiplier"])
+        
+        # 執行回測
+        initial_capital_float = float(initial_capital)
+        cash = initial_capital_float  # 現金
+        shares = 0  # 股數
+        position = 0  # 是否持有部位
+        entry_price = 0  # 買入價格
+        entry_date = None  # 買入日期
+        stop_loss = 0  # 停損價
+        trades = []
+        equity_curve = []  # 資金曲線（總資產 = 現金 + 股票價值）
+        buy_signals = []  # 買入點
+        sell_signals = []  # 賣出點
+        macd_data = []  # MACD 數據
+        rsi_data = []  # RSI 數據
+        adx_data = []  # ADX 數據
+        
+        # 固定倉位比例（50%）
+        position_size = 1.0
+        
+        # 從有足夠歷史資料的地方開始
+        start_idx = 30  # 避開前面需要計算指標的資料
+        
+        for i in range(start_idx, len(df)):
+            current_price = float(df['Close'].iloc[i])
+            current_time = str(df.index[i].date())
+            
+            # 記錄技術指標
+            macd_data.append({
+                "time": current_time,
+                "macd": round(float(df['MACD'].iloc[i]), 4),
+                "signal": round(float(df['MACD_Signal'].iloc[i]), 4),
+                "hist": round(float(df['MACD_Hist'].iloc[i]), 4)
+            })
+            rsi_data.append({
+                "time": current_time,
+                "rsi": round(float(df['RSI'].iloc[i]), 2)
+            })
+            adx_data.append({
+                "time": current_time,
+                "adx": round(float(df['ADX'].iloc[i]), 2)
+            })
+            
+            # 計算總資產（現金 + 股票價值）
+            if position:
+                current_equity = cash + shares * current_price
+            else:
+                current_equity = cash
+            
+            # 記錄為相對於初始資金的比例 (%)
+            equity_pct = (current_equity - initial_capital_float) / initial_capital_float * 100
+            equity_curve.append({
+                "time": current_time,
+                "equity": round(current_equity, 2),
+                "equity_pct": round(equity_pct, 2)
+            })
+            
+            # 買入訊號
+            if df.iloc[i]['GC_Confirm'] and position == 0:
+                # 用當時的全部資金買入
+                if current_price > 0:
+                    shares = int(cash // current_price)
+                    cost = shares * current_price
+                    cash = cash - cost  # 剩下的是現金
+                entry_price = current_price
+                entry_date = df.index[i]
+                stop_loss = entry_price - sl_mult * float(df['ATR'].iloc[i])
+                position = 1
+                
+                # 記錄買入點
+                buy_signals.append({
+                    "time": current_time,
+                    "price": float(round(entry_price, 2)),
+                    "index": i - start_idx  # 改為相對於 price_data 的索引
+                })
+                
+            # 賣出訊號：死亡交叉或觸發 ATR 停損
+            elif position == 1 and (df.iloc[i]['DC'] or current_price <= stop_loss):
+                exit_price = current_price
+                exit_reason = "death_cross" if df.iloc[i]['DC'] else "stop_loss"
+                exit_date = df.index[i]
+                
+                # 計算此筆交易的報酬率
+                pnl_pct = (exit_price - entry_price) / entry_price * 100
+                is_win = pnl_pct > 0
+                
+                trades.append({
+                    "id": len(trades) + 1,
+                    "entry_date": str(entry_date.date()),
+                    "exit_date": current_time,
+                    "entry_price": float(round(entry_price, 2)),
+                    "exit_price": float(round(exit_price, 2)),
+                    "pnl": float(round(pnl_pct, 2)),
+                    "win": bool(is_win),
+                    "exit_reason": exit_reason
+                })
+                
+                # 記錄賣出點
+                sell_signals.append({
+                    "time": current_time,
+                    "price": float(round(exit_price, 2)),
+                    "index": i - start_idx,  # 改為相對於 price_data 的索引
+                    "pnl": float(round(pnl_pct, 2))
+                })
+                
+                # 賣出股票，回收全部資金
+                cash = cash + shares * exit_price
+                shares = 0
+                position = 0
+        
+        # 統計
+        total = len(trades)
+        winning = [t for t in trades if t.get("win") is True or t.get("win") == "true"]
+        win_rate = len(winning) / total * 100 if total > 0 else 0
+        
+        # 計算總報酬率（基於最後一天的 equity_pct）
+        final_equity_pct = 0
+        if equity_curve:
+            final_equity_pct = equity_curve[-1].get("equity_pct", 0)
+        
+        # 計算回撤曲線（基於 equity_pct）
+        drawdown = []
+        if equity_curve and len(equity_curve) > 0:
+            peak_pct = 0  # 峰值%（從0開始）
+            current_dd = 0  # 當前回撤%
+            
+            for item in equity_curve:
+                equity_pct = item.get("equity_pct", 0)
+                
+                # 更新峰值
+                if equity_pct >= peak_pct:
+                    peak_pct = equity_pct
+                    current_dd = 0  # 回到高點，回撤歸零
+                elif equity_pct < peak_pct:
+                    # 計算新回撤
+                    current_dd = peak_pct - equity_pct
+                
+                drawdown.append({
+                    "time": item["time"],
+                    "drawdown": round(current_dd, 2)
+                })
+        
+        max_dd = 0
+        if drawdown:
+            max_dd = max([d["drawdown"] for d in drawdown])
+        
+        return {
+            "total_trades": total,
+            "wins": len(winning),
+            "losses": total - len(winning),
+            "win_rate": round(win_rate, 2),
+            "total_return": round(final_equity_pct, 2),
+            "trades": trades,
+            "equity_curve": equity_curve,
+            "buy_signals": buy_signals,
+            "sell_signals": sell_signals,
+            "price_data": price_data,
+            "drawdown": drawdown,
+            "macd_data": macd_data,
+            "rsi_data": rsi_data,
+            "adx_data": adx_data,
+            "max_drawdown": round(max_dd, 2),
+            "final_capital": round(equity_curve[-1]["equity"], 2) if equity_curve else round(initial_capital_float, 2),
+            "params": params
+        }
+        
+    except Exception as e:
+        return {"error": f"{str(e)}\n{traceback.format_exc()}"}
@@ -0,0 +1,9 @@
+"""
+Web Dashboard 啟動入口
+spawn 子程序會以 __mp_main__ 重新執行主程式；這裡只在 __main__ 下匯入 app，
+優化器的子程序因此不會重複建立 Flask app、JsonManager 與載入 yfinance
+"""
+
+if __name__ == '__main__':
+    from app import main
+    main()
@@ -1,12 +1,57 @@
 """
 技術指標計算模組
 """
+from datetime import datetime, time
+from zoneinfo import ZoneInfo
 import pandas as pd
 import numpy as np
-from ta.momentum import RSIIndicator
-from ta.trend import MACD, ADXIndicator
-from ta.volatility import AverageTrueRange
 from config import STRATEGY_PARAMS
+from indicators_kernels import (
+    _macd, _rsi_wilder, _atr_wilder, _adx_wilder, _moving_mean
+)
+
+
+# 指標欄位
+INDICATOR_COLUMNS = [
+    'MACD_DIF', 'MACD_DEA', 'MACD_HIST', 'RSI',
+    'ADX', 'DI_Plus', 'DI_Minus', 'ATR', 'MA20'
+]
+
+MA_WINDOW = 20
+
+# 交叉判斷所需的最少棒數（不含當根）
+CROSS_LOOKBACK = 5
+
+# 台股交易時段
+TAIPEI_TZ = ZoneInfo('Asia/Taipei')
+MARKET_OPEN = time(9, 0)
+MARKET_CLOSE = time(13, 30)
+
+
+def _indicator_arrays(high, low, close, params):
+    """
+    以 float64 陣列計算所有指標
+    Returns:
+        dict: 欄位名稱 -> 指標陣列
+    """
+    macd_params = params["macd"]
+    adx_n = params["adx"]["period"]
+    
+    dif, dea, hist = _macd(close, macd_params["fast"], macd_params["slow"], macd_params["signal"])
+    adx, di_plus, di_minus = _adx_wilder(high, low, close, adx_n)
+    
+    return {
+        'MACD_DIF': dif,      # DIF
+        'MACD_DEA': dea,      # DEA
+        'MACD_HIST': hist,    # 柱狀圖
+        'RSI': _rsi_wilder(close, params["rsi"]["period"]),
+        'ADX': adx,
+        'DI_Plus': di_plus,
+        'DI_Minus': di_minus,
+        'ATR': _atr_wilder(high, low, close, params["atr"]["period"]),
+        # 計算均線（用於判斷近一年新高）
+        'MA20': _moving_mean(close, MA_WINDOW)
+    }
 
 
 class TechnicalIndicators:
@@ -32,52 +77,43 @@ class TechnicalIndicators:
         Returns:
             pandas DataFrame 包含所有指標
         """
-        result = df.copy()
-        
-        # MACD
-        macd = MACD(
-            close=result['Close'],
-            window_slow=self.macd_params["slow"],
-            window_fast=self.macd_params["fast"],
-            window_sign=self.macd_params["signal"]
-        )
-        result['MACD_DIF'] = macd.macd()      # DIF
-        result['MACD_DEA'] = macd.macd_signal()  # DEA
-        result['MACD_HIST'] = macd.macd_diff()   # 柱狀圖
-        
-        # RSI
-        rsi = RSIIndicator(
-            close=result['Close'],
-            window=self.rsi_params["period"]
-        )
-        result['RSI'] = rsi.rsi()
-        
-        # ADX
-        adx = ADXIndicator(
-            high=result['High'],
-            low=result['Low'],
-            close=result['Close'],
-            window=self.adx_params["period"]
-        )
-        result['ADX'] = adx.adx()
-        result['DI_Plus'] = adx.adx_pos()
-        result['DI_Minus'] = adx.adx_neg()
-        
-        # ATR
-        atr = AverageTrueRange(
-            high=result['High'],
-            low=result['Low'],
-            close=result['Close'],
-            window=self.atr_params["period"]
+        return self._assemble(df, self._full_arrays(df))
+    
+    @staticmethod
+    def _assemble(df, arrays):
+        """
+        以原始欄位與指標陣列組成結果，原始欄位直接引用、不複製 DataFrame
+        指標欄位轉為 float32，訊號判斷不需要 float64 的精度
+        """
+        columns = {col: df[col] for col in df.columns}
+        for col in INDICATOR_COLUMNS:
+            columns[col] = arrays[col].astype(np.float32)
+        return pd.DataFrame(columns, index=df.index, copy=False)
+    
+    def _full_arrays(self, df):
+        """完整重新計算所有指標（float64，數值與 ta 套件一致）"""
+        return _indicator_arrays(*self._price_arrays(df), self.params)
+    
+    @staticmethod
+    def _price_arrays(df):
+        return (
+            df['High'].to_numpy(dtype=np.float64),
+            df['Low'].to_numpy(dtype=np.float64),
+            df['Close'].to_numpy(dtype=np.float64)
         )
-        result['ATR'] = atr.average_true_range()
-        
-        # 計算均線（用於判斷近一年新高）
-        result['MA20'] = result['Close'].rolling(window=20).mean()
-        
-        return result
     
-    def detect_golden_cross(self, df, lookback=5):
+    # ============ 訊號判斷 ============
+    
+    @staticmethod
+    def _last_scalars(df, cols):
+        """
+        一次取出多個欄位最後一根的數值
+        轉為 Python float：指標欄位是 float32，直接 round 會帶出二進位誤差，
+        也無法以 json 寫入
+        """
+        return {col: float(df[col].to_numpy()[-1]) for col in cols}
+    
+    def detect_golden_cross(self, df, lookback=CROSS_LOOKBACK):
         """
         偵測 MACD 黃金交叉
         Args:
@@ -89,15 +125,18 @@ class TechnicalIndicators:
         if len(df) < lookback + 1:
             return {"detected": False, "reason": "資料不足"}
         
-        # 檢查第 0 根是否發生黃金交叉
-        current = df.iloc[-1]
-        previous = df.iloc[-2]
-        
-        # 黃金交叉條件：DIF 向上穿越 DEA
-        golden_cross = (
-            (current['MACD_DIF'] > current['MACD_DEA']) and
-            (previous['MACD_DIF'] <= previous['MACD_DEA'])
+        last = self._last_scalars(df, ['ATR', 'MACD_HIST'])
+        return self._detect_golden_cross_arrays(
+            df['MACD_DIF'].to_numpy(),
+            df['MACD_DEA'].to_numpy(),
+            last['ATR'],
+            last['MACD_HIST']
         )
+    
+    def _detect_golden_cross_arrays(self, dif, dea, atr_last, hist_last):
+        """黃金交叉判斷（DIF / DEA 陣列版本）"""
+        # 黃金交叉條件：第 0 根 DIF 向上穿越 DEA
+        golden_cross = dif[-1] > dea[-1] and dif[-2] <= dea[-2]
         
         if not golden_cross:
             return {"detected": False, "reason": "無黃金交叉"}
@@ -105,15 +144,12 @@ class TechnicalIndicators:
         # 檢查接下來 3 根 DIF 是否都在 DEA 上方
         confirm_bars = self.params.get("confirm_bars", 3)
         
-        if len(df) < confirm_bars + 1:
+        if len(dif) < confirm_bars + 1:
             return {"detected": False, "reason": "資料不足，無法確認"}
         
         # 檢查第 1, 2, 3 根是否 DIF > DEA
-        all_above = True
-        for i in range(1, confirm_bars + 1):
-            if df.iloc[-i]['MACD_DIF'] <= df.iloc[-i]['MACD_DEA']:
-                all_above = False
-                break
+        start = len(dif) - confirm_bars
+        all_above = bool((dif[start:] > dea[start:]).all())
         
         if not all_above:
             return {
@@ -123,8 +159,8 @@ class TechnicalIndicators:
             }
         
         # 計算黃金交叉強度
-        diff = current['MACD_DIF'] - current['MACD_DEA']
-        strength = min(abs(diff) / (current['ATR'] + 0.001) * 100, 100)
+        diff = float(dif[-1]) - float(dea[-1])
+        strength = min(abs(diff) / (atr_last + 0.001) * 100, 100)
         
         return {
             "detected": True,
@@ -132,10 +168,10 @@ class TechnicalIndicators:
             "strength": strength,
             "reason": "黃金交叉已確認",
             "diff": diff,
-            "histogram": current['MACD_HIST']
+            "histogram": hist_last
         }
     
-    def detect_death_cross(self, df, lookback=5):
+    def detect_death_cross(self, df, lookback=CROSS_LOOKBACK):
         """
         偵測 MACD 死亡交叉
         Args:
@@ -147,14 +183,16 @@ class TechnicalIndicators:
         if len(df) < 2:
             return {"detected": False, "reason": "資料不足"}
         
-        current = df.iloc[-1]
-        previous = df.iloc[-2]
-        
-        # 死亡交叉條件：DIF 向下穿越 DEA
-        death_cross = (
-            (current['MACD_DIF'] < current['MACD_DEA']) and
-            (previous['MACD_DIF'] >= previous['MACD_DEA'])
+        return self._detect_death_cross_arrays(
+            df['MACD_DIF'].to_numpy(),
+            df['MACD_DEA'].to_numpy()
         )
+    
+    @staticmethod
+    def _detect_death_cross_arrays(dif, dea):
+        """死亡交叉判斷（DIF / DEA 陣列版本）"""
+        # 死亡交叉條件：DIF 向下穿越 DEA
+        death_cross = dif[-1] < dea[-1] and dif[-2] >= dea[-2]
         
         return {
             "detected": death_cross,
@@ -163,28 +201,28 @@ class TechnicalIndicators:
     
     def check_rsi(self, df):
         """檢查 RSI 狀態"""
-        current = df.iloc[-1]
+        rsi = self._last_scalars(df, ['RSI'])['RSI']
+        oversold = rsi < self.rsi_params["oversold"]
+        overbought = rsi > self.rsi_params["overbought"]
         
         return {
-            "value": current['RSI'],
-            "oversold": current['RSI'] < self.rsi_params["oversold"],
-            "overbought": current['RSI'] > self.rsi_params["overbought"],
-            "neutral": not (
-                current['RSI'] < self.rsi_params["oversold"] or
-                current['RSI'] > self.rsi_params["overbought"]
-            )
+            "value": rsi,
+            "oversold": oversold,
+            "overbought": overbought,
+            "neutral": not (oversold or overbought)
         }
     
     def check_adx(self, df):
         """檢查 ADX 狀態"""
-        current = df.iloc[-1]
+        last = self._last_scalars(df, ['ADX', 'DI_Plus', 'DI_Minus'])
+        adx, di_plus, di_minus = last['ADX'], last['DI_Plus'], last['DI_Minus']
         
         return {
-            "value": current['ADX'],
-            "strong_trend": current['ADX'] > self.adx_params["threshold"],
-            "di_plus": current['DI_Plus'],
-            "di_minus": current['DI_Minus'],
-            "trend_direction": "up" if current['DI_Plus'] > current['DI_Minus'] else "down"
+            "value": adx,
+            "strong_trend": adx > self.adx_params["threshold"],
+            "di_plus": di_plus,
+            "di_minus": di_minus,
+            "trend_direction": "up" if di_plus > di_minus else "down"
         }
     
     def calculate_stop_loss(self, df, entry_price, entry_bar_index=None):
@@ -193,8 +231,8 @@ class TechnicalIndicators:
         停損 = 進場價 - 2 * ATR
         若創近一年新高，則使用 max(原停損, 最高價 - 2 * ATR)
         """
-        current = df.iloc[-1]
-        atr = current['ATR']
+        last = self._last_scalars(df, ['Close', 'ATR'])
+        atr = last['ATR']
         
         # 基本停損
         base_stop_loss = entry_price - (atr * self.params["stop_loss_multiplier"])
@@ -205,11 +243,11 @@ class TechnicalIndicators:
         if len(df) >= lookback and entry_bar_index is not None:
             # 計算近一年最高價
             high_lookback = min(lookback, len(df))
-            highs = df['High'].iloc[-high_lookback:]
+            highs = df['High'].to_numpy()
             
             # 如果進場那根 K 棒是近一年新高
-            entry_high = df.iloc[entry_bar_index]['High'] if entry_bar_index else df.iloc[-1]['High']
-            one_year_high = highs.max()
+            entry_high = highs[entry_bar_index] if entry_bar_index else highs[-1]
+            one_year_high = highs[-high_lookback:].max()
             
             if entry_high >= one_year_high * 0.98:  # 接近新高
                 # 使用較高的停損價
@@ -228,30 +266,19 @@ class TechnicalIndicators:
             "atr": round(atr, 2),
             "base_stop_loss": round(base_stop_loss, 2),
             "is_new_high_stop": is_new_high,
-            "risk_reward_ratio": round((current['Close'] - stop_loss) / atr, 2)
+            "risk_reward_ratio": round((last['Close'] - stop_loss) / atr, 2)
         }
     
     def is_market_open(self):
         """檢查是否在交易時間內"""
-        from datetime import datetime, time
-        import pytz
-        
-        now = datetime.now(pytz.timezone('Asia/Taipei'))
-        current_time = now.time()
-        current_weekday = now.weekday()
-        
-        start_time = time(9, 0)
-        end_time = time(13, 30)
+        now = datetime.now(TAIPEI_TZ)
         
         # 檢查是否為平日
-        if current_weekday not in [0, 1, 2, 3, 4]:
+        if now.weekday() >= 5:
             return False
         
         # 檢查是否在交易時段
-        if start_time <= current_time <= end_time:
-            return True
-        
-        return False
+        return MARKET_OPEN <= now.time() <= MARKET_CLOSE
     
     def should_buy(self, df):
         """
@@ -261,16 +288,24 @@ class TechnicalIndicators:
         2. RSI < 50（不能太超買）
         3. ADX > 15（有趨勢）
         """
-        current = df.iloc[-1]
+        last = self._last_scalars(df, ['RSI', 'ADX', 'ATR', 'MACD_HIST'])
         
         # 檢查 MACD 黃金交叉
-        gc = self.detect_golden_cross(df)
+        if len(df) < CROSS_LOOKBACK + 1:
+            gc = {"detected": False, "reason": "資料不足"}
+        else:
+            gc = self._detect_golden_cross_arrays(
+                df['MACD_DIF'].to_numpy(),
+                df['MACD_DEA'].to_numpy(),
+                last['ATR'],
+                last['MACD_HIST']
+            )
         
         # RSI 狀態
-        rsi_oversold = current['RSI'] < 50  # 偏弱或超賣
+        rsi_oversold = last['RSI'] < 50  # 偏弱或超賣
         
         # ADX 狀態
-        adx_trend = current['ADX'] > 15  # 有趨勢
+        adx_trend = last['ADX'] > 15  # 有趨勢
         
         # 綜合判斷
         buy_score = 0
@@ -302,8 +337,8 @@ class TechnicalIndicators:
             "macd_confirmed": gc["confirmed"],
             "rsi_oversold": rsi_oversold,
             "adx_trend": adx_trend,
-            "rsi_value": round(current['RSI'], 2),
-            "adx_value": round(current['ADX'], 2)
+            "rsi_value": round(last['RSI'], 2),
+            "adx_value": round(last['ADX'], 2)
         }
     
     def should_sell(self, df):
@@ -314,16 +349,16 @@ class TechnicalIndicators:
         2. RSI > 70（超買）
         3. ADX < 15（無趨勢）
         """
-        current = df.iloc[-1]
+        last = self._last_scalars(df, ['RSI', 'ADX'])
         
         # 檢查 MACD 死亡交叉
         dc = self.detect_death_cross(df)
         
         # RSI 狀態
-        rsi_overbought = current['RSI'] > 70
+        rsi_overbought = last['RSI'] > 70
         
         # ADX 狀態
-        no_trend = current['ADX'] < 15
+        no_trend = last['ADX'] < 15
         
         # 賣出條件
         should_sell = dc["detected"] or rsi_overbought or no_trend
@@ -342,6 +377,6 @@ class TechnicalIndicators:
             "death_cross": dc["detected"],
             "rsi_overbought": rsi_overbought,
             "no_trend": no_trend,
-            "rsi_value": round(current['RSI'], 2),
-            "adx_value": round(current['ADX'], 2)
+            "rsi_value": round(last['RSI'], 2),
+            "adx_value": round(last['ADX'], 2)
         }
@@ -0,0 +1,227 @@
+"""
+技術指標運算核心（NumPy + Numba）
+計算結果與 ta 套件一致，但直接在 float64 陣列上運算
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # 未安裝 numba 時退回純 Python 執行
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda f: f
+
+try:
+    import bottleneck as bn
+except ImportError:  # 未安裝 bottleneck 時改用 np.convolve
+    bn = None
+
+
+def _moving_mean(x, window):
+    """簡單移動平均，等同 pandas rolling(window).mean()，前 window-1 根為 NaN"""
+    if len(x) < window:
+        return np.full(len(x), np.nan)
+    if bn is not None:
+        return bn.move_mean(x, window, min_count=window)
+    out = np.full(len(x), np.nan)
+    out[window - 1:] = np.convolve(x, np.ones(window) / window, mode='valid')
+    return out
+
+
+@njit(cache=True)
+def _ema(x, n):
+    """
+    指數移動平均，等同 pandas ewm(span=n, min_periods=n, adjust=False)
+    前導 NaN 會被略過，觀測值不足 n 筆時輸出 NaN
+    """
+    length = len(x)
+    out = np.empty(length)
+    alpha = 2.0 / (n + 1)
+    weighted = np.nan
+    old_wt = 1.0
+    nobs = 0
+    for i in range(length):
+        cur = x[i]
+        is_obs = cur == cur
+        if is_obs:
+            nobs += 1
+        if weighted == weighted:
+            old_wt *= 1.0 - alpha
+            if is_obs:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.0
+        elif is_obs:
+            weighted = cur
+        out[i] = weighted if nobs >= n else np.nan
+    return out
+
+
+@njit(cache=True)
+def _rsi_averages(close, n):
+    """RSI 的 Wilder 平滑漲跌幅（alpha = 1/n，不套用 min_periods）"""
+    length = len(close)
+    avg_up = np.empty(length)
+    avg_down = np.empty(length)
+    alpha = 1.0 / n
+    up_prev = 0.0
+    down_prev = 0.0
+    for i in range(length):
+        up = 0.0
+        down = 0.0
+        if i > 0:
+            diff = close[i] - close[i - 1]
+            if diff > 0:
+                up = diff
+            elif diff < 0:
+                down = -diff
+        if i == 0:
+            up_prev = up
+            down_prev = down
+        else:
+            up_prev = up_prev + alpha * (up - up_prev)
+            down_prev = down_prev + alpha * (down - down_prev)
+        avg_up[i] = up_prev
+        avg_down[i] = down_prev
+    return avg_up, avg_down
+
+
+@njit(cache=True)
+def _rsi_wilder(close, n):
+    """RSI（Wilder 平滑），前 n 根輸出 NaN"""
+    avg_up, avg_down = _rsi_averages(close, n)
+    length = len(close)
+    out = np.empty(length)
+    for i in range(length):
+        if i < n - 1:
+            out[i] = np.nan
+        elif avg_down[i] == 0:
+            out[i] = 100.0
+        else:
+            out[i] = 100.0 - 100.0 / (1.0 + avg_up[i] / avg_down[i])
+    return out
+
+
+@njit(cache=True)
+def _macd(close, fast, slow, sig):
+    """MACD，回傳 (DIF, DEA, 柱狀圖)"""
+    dif = _ema(close, fast) - _ema(close, slow)
+    dea = _ema(dif, sig)
+    return dif, dea, dif - dea
+
+
+@njit(cache=True)
+def _true_range(high, low, close):
+    """真實波幅，第一根為 high - low"""
+    length = len(close)
+    tr = np.empty(length)
+    for i in range(length):
+        tr[i] = high[i] - low[i]
+        if i > 0:
+            tr[i] = max(tr[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1]))
+    return tr
+
+
+@njit(cache=True)
+def _atr_wilder(high, low, close, n):
+    """ATR（Wilder 平滑），前 n-1 根為 0"""
+    tr = _true_range(high, low, close)
+    length = len(close)
+    atr = np.zeros(length)
+    if length < n:
+        return atr
+    atr[n - 1] = tr[:n].mean()
+    for i in range(n, length):
+        atr[i] = (atr[i - 1] * (n - 1) + tr[i]) / n
+    return atr
+
+
+@njit(cache=True)
+def _directional_smooth(high, low, close, n):
+    """
+    ADX 使用的 TR / +DM / -DM Wilder 平滑序列
+    與 ta 相同：索引 i 對應第 n + i 根 K 棒，長度為 len - n + 1
+    """
+    length = len(close)
+    size = length - n + 1
+    trs = np.zeros(size)
+    dip = np.zeros(size)
+    din = np.zeros(size)
+    if size < 2:
+        return trs, dip, din
+
+    # ta 的 ADX 以 max(high, 前收) - min(low, 前收) 計算波幅，第一根無值
+    tr = np.zeros(length)
+    pos = np.zeros(length)
+    neg = np.zeros(length)
+    for i in range(1, length):
+        tr[i] = max(high[i], close[i - 1]) - min(low[i], close[i - 1])
+        diff_up = high[i] - high[i - 1]
+        diff_down = low[i - 1] - low[i]
+        if diff_up > diff_down and diff_up > 0:
+            pos[i] = diff_up
+        if diff_down > diff_up and diff_down > 0:
+            neg[i] = diff_down
+
+    trs[0] = tr[1:n + 1].sum()
+    dip[0] = pos[1:n + 1].sum()
+    din[0] = neg[1:n + 1].sum()
+    for i in range(1, size - 1):
+        trs[i] = trs[i - 1] - trs[i - 1] / n + tr[n + i]
+        dip[i] = dip[i - 1] - dip[i - 1] / n + pos[n + i]
+        din[i] = din[i - 1] - din[i - 1] / n + neg[n + i]
+    return trs, dip, din
+
+
+@njit(cache=True)
+def _adx_wilder(high, low, close, n):
+    """
+    ADX 與 +DI / -DI 一次算出，回傳 (adx, di_plus, di_minus)
+    ADX 前 2n-1 根為 0，DI 前 n 根為 0（與 ta 相同）
+    """
+    trs, dip, din = _directional_smooth(high, low, close, n)
+    length = len(close)
+    size = len(trs)
+    adx = np.zeros(length)
+    di_plus = np.zeros(length)
+    di_minus = np.zeros(length)
+    if size < 2:
+        return adx, di_plus, di_minus
+
+    dx = np.zeros(size)
+    for i in range(size):
+        if trs[i] != 0:
+            plus = 100.0 * dip[i] / trs[i]
+            minus = 100.0 * din[i] / trs[i]
+        else:
+            plus = 0.0
+            minus = 0.0
+        if plus + minus != 0:
+            dx[i] = 100.0 * abs((plus - minus) / (plus + minus))
+        # ta 的 DI 序列不含平滑序列的第一個與最後一個值
+        if 0 < i < size - 1:
+            di_plus[i + n] = plus
+            di_minus[i + n] = minus
+
+    if size <= n:
+        return adx, di_plus, di_minus
+    prev = dx[:n].mean()
+    adx[2 * n - 1] = prev
+    for i in range(n + 1, size):
+        prev = (prev * (n - 1) + dx[i - 1]) / n
+        adx[i + n - 1] = prev
+    return adx, di_plus, di_minus
+
+
+def warmup():
+    """以小型資料觸發編譯（cache=True 時會寫入磁碟快取，之後啟動直接載入）"""
+    x = np.linspace(100.0, 110.0, 64)
+    high = x + 1.0
+    low = x - 1.0
+    _macd(x, 12, 26, 9)
+    _rsi_wilder(x, 14)
+    _rsi_averages(x, 14)
+    _atr_wilder(high, low, x, 14)
+    _adx_wilder(high, low, x, 14)
+    _directional_smooth(high, low, x, 14)
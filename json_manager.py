@@ -3,12 +3,31 @@ JSON 文件管理模組 - 取代 MongoDB
 """
 import json
 import os
+import time
+import heapq
 import shutil
+import orjson
+import atexit
+import functools
+import threading
 import logging
+import numpy as np
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+
+def _now_ms():
+    """目前時間（epoch 毫秒）"""
+    return time.time_ns() // 1_000_000
+
+
+def _iso_to_ms(value):
+    """ISO 時間字串（本地時間）轉 epoch 毫秒"""
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
 from config import (
     POSITIONS_FILE, TRADES_FILE, SIGNALS_FILE, 
     LOGS_FILE, CONFIG_FILE, DATA_DIR, TradingState,
@@ -16,6 +35,18 @@ from config import (
 )
 
 
+def _synchronized(method):
+    """
+    整個方法持有實例的 _lock 執行
+    掃描（JobQueue 執行緒）與 Telegram 指令（to_thread）同時存取時，讀取-修改-寫入不會交錯
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class JsonManager:
     """JSON 文件管理類"""
     
@@ -25,11 +56,45 @@ class JsonManager:
         os.makedirs(self.data_dir, exist_ok=True)
         
         # 確保文件存在
-        for file_path in [POSITIONS_FILE, TRADES_FILE, SIGNALS_FILE, LOGS_FILE]:
+        for file_path in [POSITIONS_FILE, TRADES_FILE, SIGNALS_FILE]:
             if not os.path.exists(file_path):
                 with open(file_path, 'w', encoding='utf-8') as f:
                     json.dump([], f)
         
+        # 持倉快取，檔案修改時間或大小改變時重新讀取
+        self._pos_cache = None
+        self._pos_index = None
+        self._pos_status_index = None
+        self._pos_summary = None
+        self._pos_cache_mtime = None
+        
+        # 所有 JSON 檔的解析結果快取：path -> ((mtime_ns, size), data)
+        self._json_cache = {}
+        
+        # 資料存取鎖：持倉 / 交易 / 訊號的讀寫、新增緩衝與批次區塊都持有此鎖
+        self._lock = threading.RLock()
+        
+        # 批次模式的層數與尚未寫入磁碟的資料屬於開啟批次的執行緒
+        self._local = threading.local()
+        
+        # 訊號 / 日誌新增緩衝，累積足量或逾時後一次寫入（交易只在批次區塊內暫存）
+        self._insert_buf = {TRADES_FILE: [], SIGNALS_FILE: []}
+        self._log_buf = []
+        self._flush_timer = None
+        atexit.register(self.flush)
+        
+        # 交易統計累計值：{symbol 或 None(全部): [筆數, 獲利筆數, 損益總和, 最大, 最小]}
+        self._trade_stats = None
+        self._trade_stats_base = None     # 累計值對應的交易檔內容（物件本身）
+        self._trade_stats_pending = 0     # 已計入的緩衝筆數
+        
+        # 交易時間索引：(交易檔內容, 新到舊排序的全部交易, {symbol: 新到舊排序的交易})
+        self._trade_order = (None, [], {})
+        
+        # 日誌為 JSON Lines；轉換舊格式與裁切只在交易機器人程序執行（start_log_rotation）
+        self._log_writes = 0
+        self._rotate_log_file = False
+        
         # 確保監控股票文件存在
         if not os.path.exists(SYMBOLS_FILE):
             with open(SYMBOLS_FILE, 'w', encoding='utf-8') as f:
@@ -37,54 +102,380 @@ class JsonManager:
     
     # ============ 文件讀寫 ============
     
+    # numpy 數值直接寫成數字；不加 OPT_NAIVE_UTC，
+    # 冷卻時間等欄位是本地時間，會與 datetime.now() 比較
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    
     def _read_json(self, file_path):
-        """讀取 JSON 文件"""
+        """
+        讀取 JSON 文件（目前執行緒在批次模式下時，優先回傳該批次尚未寫入的資料）
+        檔案修改時間與大小未變時直接回傳上次的解析結果；回傳物件為共用，修改前須複製
+        """
+        pending = self._pending_writes.get(file_path)
+        if pending is not None:
+            return pending
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            return []
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._json_cache.get(file_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
+            with open(file_path, 'rb') as f:
+                data = orjson.loads(f.read())
+        except (orjson.JSONDecodeError, FileNotFoundError):
             return []
+        self._json_cache[file_path] = (stamp, data)
+        return data
     
-    def _write_json(self, file_path, data):
-        """寫入 JSON 文件（Railway filesystem 唯讀，可能失敗）"""
+    def _write_json(self, file_path, data, pretty=False):
+        """
+        寫入 JSON 文件（Railway filesystem 唯讀，可能失敗）
+        只有人工編輯的設定檔使用 pretty=True 縮排
+        """
+        if self._batch_depth and file_path in self._DEFERRABLE_FILES:
+            self._pending_writes[file_path] = data
+            return
         try:
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+            option = self._ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if pretty else 0)
+            self._atomic_write(file_path, orjson.dumps(data, option=option, default=str),
+                               fsync=file_path not in self._NO_FSYNC_FILES)
+            st = os.stat(file_path)
+            self._json_cache[file_path] = ((st.st_mtime_ns, st.st_size), data)
         except Exception as e:
             # Railway filesystem 唯讀，忽略寫入錯誤
             print(f"警告: 無法寫入 {file_path} ({e})，數據可能僅存儲在內存中")
     
+    # ============ 批次寫入 ============
+    
+    # 掃描迴圈中頻繁變動的檔案，批次模式下延後寫入
+    _DEFERRABLE_FILES = (POSITIONS_FILE, TRADES_FILE, SIGNALS_FILE)
+    
+    # 只供查詢、可容忍斷電遺失的檔案，寫入時不等待 fsync（持倉與交易仍同步落盤）
+    _NO_FSYNC_FILES = (SIGNALS_FILE,)
+    
+    @property
+    def _batch_depth(self):
+        return getattr(self._local, "batch_depth", 0)
+    
+    @_batch_depth.setter
+    def _batch_depth(self, value):
+        self._local.batch_depth = value
+    
+    @property
+    def _pending_writes(self):
+        pending = getattr(self._local, "pending_writes", None)
+        if pending is None:
+            pending = self._local.pending_writes = {}
+        return pending
+    
+    @contextmanager
+    def batch(self):
+        """
+        批次模式：區塊內的持倉 / 交易 / 訊號 / 日誌寫入只更新記憶體，
+        離開最外層區塊時一次寫入磁碟
+        整個區塊持有 _lock：其他執行緒的操作（例如 Telegram 確認買賣）會等到
+        區塊寫入磁碟後才執行，不會被併入這次批次，也不會被批次結果覆蓋
+        區塊內不要做網路 I/O（下載股價、Dashboard API），先在區塊外取得資料，
+        否則其他執行緒要等到整個下載結束
+        """
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.flush()
+    
+    def flush(self):
+        """將緩衝與批次模式累積的變更寫入磁碟"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            depth, self._batch_depth = self._batch_depth, 0
+            try:
+                self._flush_buffers()
+                while self._pending_writes:
+                    file_path, data = self._pending_writes.popitem()
+                    self._write_json(file_path, data)
+                    if file_path == POSITIONS_FILE:
+                        self._pos_cache_mtime = None
+            finally:
+                self._batch_depth = depth
+    
+    # ============ 新增緩衝 ============
+    
+    INSERT_FLUSH_SIZE = 256       # 緩衝筆數達此值立即寫入
+    INSERT_FLUSH_INTERVAL = 1.0   # 秒，最舊一筆緩衝的最長等待時間
+    
+    def _buffer_insert(self, file_path, record):
+        """將訊號加入緩衝"""
+        with self._lock:
+            self._insert_buf[file_path].append(record)
+            self._schedule_flush()
+    
+    def _buffered_records(self, file_path):
+        """檔案內容加上尚未寫入的緩衝紀錄"""
+        with self._lock:
+            return self._read_json(file_path) + self._insert_buf[file_path]
+    
+    def _schedule_flush(self):
+        """緩衝足量時立即寫入，否則排程計時寫入（呼叫端須持有 _lock）"""
+        if self._batch_depth:  # 批次區塊結束時統一寫入
+            return
+        pending = len(self._log_buf) + sum(len(b) for b in self._insert_buf.values())
+        if pending >= self.INSERT_FLUSH_SIZE:
+            self._flush_buffers()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.INSERT_FLUSH_INTERVAL, self._timer_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def _timer_flush(self):
+        with self._lock:
+            self._flush_timer = None
+            if not self._batch_depth:
+                self._flush_buffers()
+    
+    def _flush_buffers(self):
+        """每個檔案只讀寫一次，寫入所有緩衝的新增紀錄（呼叫端須持有 _lock）"""
+        for file_path in self._insert_buf:
+            self._flush_inserts(file_path)
+        if self._log_buf:
+            lines, self._log_buf = self._log_buf, []
+            self._append_logs(lines)
+    
+    def _flush_inserts(self, file_path):
+        """寫入單一檔案緩衝的新增紀錄（呼叫端須持有 _lock）"""
+        records = self._insert_buf[file_path]
+        if not records:
+            return
+        base = self._read_json(file_path)
+        data = base + records
+        self._write_json(file_path, data)
+        if (file_path == TRADES_FILE and base is self._trade_stats_base
+                and self._trade_stats_pending == len(records)):
+            # 緩衝的交易已計入統計，寫入後改以新內容為基準，不必重算
+            self._trade_stats_base = data
+            self._trade_stats_pending = 0
+        records.clear()
+    
+    @staticmethod
+    def _atomic_write(file_path, payload, fsync=True):
+        """
+        先寫入暫存檔再 os.replace，寫入中斷時不會留下半個 JSON
+        fsync=False 用於可容忍遺失的日誌與訊號
+        暫存檔名含行程與執行緒 ID，同一行程的多個執行緒同時寫入同一檔案時不會互相覆蓋
+        """
+        tmp = f"{file_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(payload)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, file_path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+    
+    @staticmethod
+    def _make_id(symbol):
+        """以奈秒時間戳產生 ID；秒級時間戳在同一秒內會重複"""
+        return f"{symbol}_{time.time_ns():x}"
+    
+    @staticmethod
+    def _latest(records, limit, time_key):
+        """
+        取最新的 limit 筆（新到舊）
+        依 _ts（epoch 奈秒）排序；舊資料沒有 _ts，排在後面並以 ISO 字串排序
+        """
+        return heapq.nlargest(limit, records, key=lambda x: (x.get("_ts", 0), x.get(time_key, "")))
+    
+    @staticmethod
+    def _project(records, fields):
+        """
+        只保留指定欄位（fields 為 None 時原樣回傳）；不存在的欄位直接略過
+        "holding_info.stop_loss" 形式只保留子欄位並維持巢狀結構（欄位之間不可重疊）
+        """
+        if fields is None:
+            return records
+        if not any("." in f for f in fields):
+            return [{k: r[k] for k in fields if k in r} for r in records]
+        paths = [f.split(".") for f in fields]
+        result = []
+        for r in records:
+            item = {}
+            for path in paths:
+                value = r
+                for key in path:
+                    if not isinstance(value, dict) or key not in value:
+                        break
+                    value = value[key]
+                else:
+                    node = item
+                    for key in path[:-1]:
+                        node = node.setdefault(key, {})
+                    node[path[-1]] = value
+            result.append(item)
+        return result
+    
     # ============ 持倉管理 ============
     
+    def _read_positions(self):
+        """讀取持倉（依檔案 mtime / 大小快取；回傳的物件為共用，不可直接修改）"""
+        return self._read_positions_indexed()[0]
+    
+    def _read_positions_indexed(self):
+        """
+        讀取持倉與股票代碼索引
+        Returns:
+            (持倉列表, {symbol: [該股票持倉在列表中的位置，依檔案順序]})
+        同時建立狀態索引 self._pos_status_index: {status: [位置]}
+        """
+        try:
+            st = os.stat(POSITIONS_FILE)
+        except FileNotFoundError:
+            self._pos_cache, self._pos_index, self._pos_status_index = [], {}, {}
+            self._pos_cache_mtime = None
+            return self._pos_cache, self._pos_index
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self._pos_cache_mtime:
+            positions = self._read_json(POSITIONS_FILE)
+            index = {}
+            status_index = {}
+            for i, pos in enumerate(positions):
+                index.setdefault(pos.get("symbol"), []).append(i)
+                status_index.setdefault(pos.get("status"), []).append(i)
+            self._pos_cache = positions
+            self._pos_index = index
+            self._pos_status_index = status_index
+            self._pos_summary = None
+            self._pos_cache_mtime = stamp
+        return self._pos_cache, self._pos_index
+    
+    def _positions_with_status(self, *statuses):
+        """以狀態索引取出持倉（依檔案順序），不掃描其他狀態的持倉"""
+        positions, _ = self._read_positions_indexed()
+        if len(statuses) == 1:
+            offsets = self._pos_status_index.get(statuses[0], ())
+        else:
+            offsets = heapq.merge(*(self._pos_status_index.get(s, ()) for s in statuses))
+        return [positions[i] for i in offsets]
+    
+    @staticmethod
+    def _copy_for_update(positions, i):
+        """
+        複製要修改的持倉（寫入時複製），不改動快取中共用的物件
+        Returns:
+            (新的持倉列表, 可修改的持倉)
+        """
+        positions = list(positions)
+        pos = positions[i] = dict(positions[i])
+        return positions, pos
+    
+    def _write_positions(self, positions):
+        """
+        寫入持倉並使快取失效
+        順便移除已過期的冷卻持倉（類似 TTL），不需另外排程清除；
+        舊資料的冷卻持倉補上 cooldown_until_ms，之後不必再解析 ISO 字串
+        """
+        now = _now_ms()
+        kept = []
+        for p in positions:
+            if p.get("status") == TradingState.COOLDOWN:
+                until = self._cooldown_until(p)
+                if until <= now:
+                    continue
+                if "cooldown_until_ms" not in p:
+                    p = dict(p, cooldown_until_ms=until)
+            kept.append(p)
+        positions = kept
+        self._write_json(POSITIONS_FILE, positions)
+        self._pos_cache_mtime = None
+    
+    @_synchronized
     def get_position(self, symbol):
         """取得特定股票的持倉"""
-        positions = self._read_json(POSITIONS_FILE)
-        for pos in positions:
-            if pos.get("symbol") == symbol and pos.get("status") in [
-                TradingState.SIGNAL_BUY_SENT, TradingState.HOLDING
-            ]:
-                return pos
+        positions, index = self._read_positions_indexed()
+        for i in index.get(symbol, ()):
+            if positions[i].get("status") in [TradingState.SIGNAL_BUY_SENT, TradingState.HOLDING]:
+                return positions[i]
         return None
     
-    def get_all_positions(self, status=None):
-        """取得所有持倉"""
-        positions = self._read_json(POSITIONS_FILE)
+    @_synchronized
+    def get_positions_by_symbols(self, symbols):
+        """
+        一次取得多檔股票的持倉（與 get_position 相同：待買入確認或持有中）
+        Returns:
+            {symbol: 持倉}，沒有持倉的股票不在結果中
+        """
+        positions, index = self._read_positions_indexed()
+        active = (TradingState.SIGNAL_BUY_SENT, TradingState.HOLDING)
+        result = {}
+        for symbol in symbols:
+            for i in index.get(symbol, ()):
+                if positions[i].get("status") in active:
+                    result[symbol] = positions[i]
+                    break
+        return result
+    
+    @_synchronized
+    def get_all_positions(self, status=None, fields=None):
+        """取得所有持倉（fields: 只回傳的欄位）"""
         if status:
-            return [p for p in positions if p.get("status") == status]
-        return [p for p in positions if p.get("status") in [
-            TradingState.SIGNAL_BUY_SENT, TradingState.HOLDING, TradingState.SIGNAL_SELL_SENT
-        ]]
+            positions = self._positions_with_status(status)
+        else:
+            positions = self._positions_with_status(
+                TradingState.SIGNAL_BUY_SENT, TradingState.HOLDING, TradingState.SIGNAL_SELL_SENT
+            )
+        return self._project(positions, fields)
+    
+    @_synchronized
+    def get_positions_summary(self):
+        """
+        進行中持倉的摘要（代碼、狀態、買入價、停損），供 Telegram 查詢指令使用
+        隨持倉快取重建一次，之後的查詢直接回傳（呼叫端不可修改）
+        Returns:
+            [{"symbol", "status", "entry_price"?, "stop_loss"?}]，只含持倉中有的欄位
+        """
+        self._read_positions_indexed()
+        if self._pos_summary is None:
+            summary = []
+            for p in self.get_all_positions():
+                holding = p.get("holding_info", {})
+                item = {"symbol": p["symbol"], "status": p["status"]}
+                item.update({k: holding[k] for k in ("entry_price", "stop_loss") if k in holding})
+                summary.append(item)
+            self._pos_summary = summary
+        return self._pos_summary
     
+    @_synchronized
     def create_position(self, symbol, signal_data, indicators):
-        """建立新持倉"""
-        positions = self._read_json(POSITIONS_FILE)
+        """
+        建立新持倉
+        已有進行中的持倉（待買入 / 持有 / 待賣出）時不覆蓋，直接回傳該持倉
+        （掃描判斷無持倉後，使用者可能已在 Telegram 確認買入）
+        """
+        positions, index = self._read_positions_indexed()
+        for i in index.get(symbol, ()):
+            if positions[i].get("status") in (TradingState.SIGNAL_BUY_SENT, TradingState.HOLDING,
+                                              TradingState.SIGNAL_SELL_SENT):
+                return positions[i]
         
         # 刪除舊的同名持倉
         positions = [p for p in positions if p.get("symbol") != symbol]
         
         position = {
-            "id": f"{symbol}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+            "id": self._make_id(symbol),
             "symbol": symbol,
             "status": TradingState.SIGNAL_BUY_SENT,
             "signal_data": {
@@ -106,104 +497,163 @@ class JsonManager:
         }
         
         positions.append(position)
-        self._write_json(POSITIONS_FILE, positions)
+        self._write_positions(positions)
         return position
     
+    @_synchronized
     def update_position_status(self, symbol, status, additional_data=None):
         """更新持倉狀態"""
-        positions = self._read_json(POSITIONS_FILE)
-        for pos in positions:
-            if pos.get("symbol") == symbol and pos.get("status") != "CLOSED":
+        positions, index = self._read_positions_indexed()
+        for i in index.get(symbol, ()):
+            if positions[i].get("status") != "CLOSED":
+                positions, pos = self._copy_for_update(positions, i)
                 pos["status"] = status
                 pos["updated_at"] = datetime.now().isoformat()
                 if additional_data:
                     pos.update(additional_data)
                 break
-        self._write_json(POSITIONS_FILE, positions)
+        self._write_positions(positions)
     
+    @_synchronized
     def add_holding_info(self, symbol, entry_price, entry_time, stop_loss, quantity=0):
         """新增持倉資訊"""
-        positions = self._read_json(POSITIONS_FILE)
-        for pos in positions:
-            if pos.get("symbol") == symbol:
-                pos["status"] = TradingState.HOLDING
-                pos["holding_info"] = {
-                    "entry_price": entry_price,
-                    "entry_time": entry_time,
-                    "stop_loss": stop_loss,
-                    "quantity": quantity
-                }
-                pos["updated_at"] = datetime.now().isoformat()
-                break
-        self._write_json(POSITIONS_FILE, positions)
+        positions, index = self._read_positions_indexed()
+        if symbol in index:
+            positions, pos = self._copy_for_update(positions, index[symbol][0])
+            pos["status"] = TradingState.HOLDING
+            pos["holding_info"] = {
+                "entry_price": entry_price,
+                "entry_time": entry_time,
+                "stop_loss": stop_loss,
+                "quantity": quantity
+            }
+            pos["updated_at"] = datetime.now().isoformat()
+        self._write_positions(positions)
     
+    @_synchronized
     def close_position(self, symbol, exit_price, exit_time, pnl_pct, trade_type="manual"):
         """關閉持倉"""
-        positions = self._read_json(POSITIONS_FILE)
-        for pos in positions:
-            if pos.get("symbol") == symbol:
-                pos["status"] = TradingState.COOLDOWN
-                pos["close_info"] = {
-                    "exit_price": exit_price,
-                    "exit_time": exit_time,
-                    "pnl_pct": pnl_pct,
-                    "trade_type": trade_type
-                }
-                pos["updated_at"] = datetime.now().isoformat()
-                pos["closed_at"] = datetime.now().isoformat()
-                break
-        self._write_json(POSITIONS_FILE, positions)
+        positions, index = self._read_positions_indexed()
+        if symbol in index:
+            positions, pos = self._copy_for_update(positions, index[symbol][0])
+            pos["status"] = TradingState.COOLDOWN
+            pos["close_info"] = {
+                "exit_price": exit_price,
+                "exit_time": exit_time,
+                "pnl_pct": pnl_pct,
+                "trade_type": trade_type
+            }
+            pos["updated_at"] = datetime.now().isoformat()
+            pos["closed_at"] = datetime.now().isoformat()
+        self._write_positions(positions)
     
+    @_synchronized
     def delete_position(self, symbol):
         """刪除持倉"""
-        positions = self._read_json(POSITIONS_FILE)
+        positions = self._read_positions()
         positions = [p for p in positions if p.get("symbol") != symbol]
-        self._write_json(POSITIONS_FILE, positions)
+        self._write_positions(positions)
+    
+    @_synchronized
+    def confirm_buy(self, symbol, entry_price, entry_time, stop_loss, quantity=0,
+                    reason="", log_message=None, module="general"):
+        """
+        使用者確認買入：寫入持倉資訊、新增交易與日誌，在同一次批次寫入完成
+        """
+        with self.batch():
+            self.add_holding_info(symbol, entry_price, entry_time, stop_loss, quantity)
+            self.add_trade(symbol, "buy", entry_price, 0, quantity, 0, reason)
+            if log_message:
+                self.log("INFO", log_message, module)
+    
+    @_synchronized
+    def confirm_sell(self, symbol, entry_price, exit_price, quantity, pnl_pct,
+                     reason="", log_message=None, module="general"):
+        """
+        使用者確認賣出：刪除持倉、新增交易與日誌，在同一次批次寫入完成
+        原本依序 close_position → set_cooldown → delete_position 三次寫入，
+        前兩次的欄位隨即被刪除，直接刪除即可得到相同結果
+        """
+        with self.batch():
+            self.delete_position(symbol)
+            self.add_trade(symbol, "sell", entry_price, exit_price, quantity, pnl_pct, reason)
+            if log_message:
+                self.log("INFO", log_message, module)
     
+    @_synchronized
     def set_cooldown(self, symbol, cooldown_until):
-        """設定冷卻"""
-        positions = self._read_json(POSITIONS_FILE)
-        for pos in positions:
-            if pos.get("symbol") == symbol:
-                pos["status"] = TradingState.COOLDOWN
-                pos["cooldown_until"] = cooldown_until
-                pos["updated_at"] = datetime.now().isoformat()
-                break
-        self._write_json(POSITIONS_FILE, positions)
+        """
+        設定冷卻
+        cooldown_until 保留 ISO 字串供顯示，另存 epoch 毫秒供比較
+        """
+        positions, index = self._read_positions_indexed()
+        if symbol in index:
+            positions, pos = self._copy_for_update(positions, index[symbol][0])
+            pos["status"] = TradingState.COOLDOWN
+            pos["cooldown_until"] = cooldown_until
+            pos["cooldown_until_ms"] = _iso_to_ms(cooldown_until)
+            pos["updated_at"] = datetime.now().isoformat()
+        self._write_positions(positions)
     
+    @staticmethod
+    def _cooldown_until(pos):
+        """
+        冷卻結束時間（epoch 毫秒）
+        舊資料只有 ISO 字串，直接解析；下次寫入持倉時會補上 cooldown_until_ms
+        """
+        until = pos.get("cooldown_until_ms")
+        if until is None:
+            until = _iso_to_ms(pos.get("cooldown_until", "2000-01-01"))
+        return until
+    
+    @_synchronized
     def get_cooldown_symbols(self):
         """取得冷卻中的股票"""
-        positions = self._read_json(POSITIONS_FILE)
-        now = datetime.now()
-        return [p for p in positions if p.get("status") == TradingState.COOLDOWN 
-                and datetime.fromisoformat(p.get("cooldown_until", "2000-01-01")) > now]
+        now = _now_ms()
+        return [p for p in self._positions_with_status(TradingState.COOLDOWN)
+                if self._cooldown_until(p) > now]
+    
+    @_synchronized
+    def get_status_bundle(self):
+        """
+        /status 指令所需資料：持倉摘要與冷卻中的股票
+        Returns:
+            {"positions": get_positions_summary(), "cooldown": [{"symbol"}]}
+        """
+        return {
+            "positions": self.get_positions_summary(),
+            "cooldown": self._project(self.get_cooldown_symbols(), ("symbol",))
+        }
     
+    @_synchronized
     def clear_expired_cooldowns(self):
         """清除過期冷卻"""
-        positions = self._read_json(POSITIONS_FILE)
-        now = datetime.now()
-        updated = False
+        positions, _ = self._read_positions_indexed()
+        now = _now_ms()
         
-        for pos in positions:
-            if pos.get("status") == TradingState.COOLDOWN:
-                cooldown_until = datetime.fromisoformat(pos.get("cooldown_until", "2000-01-01"))
-                if cooldown_until <= now:
-                    # 刪除過期的持倉
-                    positions.remove(pos)
-                    updated = True
+        # 只檢查冷卻中的持倉；沒有過期時不重建列表
+        expired = {i for i in self._pos_status_index.get(TradingState.COOLDOWN, ())
+                   if self._cooldown_until(positions[i]) <= now}
+        if not expired:
+            return len(positions)
         
-        if updated:
-            self._write_json(POSITIONS_FILE, positions)
+        # 一次刪除所有過期的持倉
+        kept = [p for i, p in enumerate(positions) if i not in expired]
+        self._write_positions(kept)
         
-        return len(positions)
+        return len(kept)
     
     # ============ 交易紀錄 ============
     
+    @_synchronized
     def add_trade(self, symbol, trade_type, entry_price, exit_price, quantity, pnl_pct, reason=""):
-        """新增交易"""
-        trades = self._read_json(TRADES_FILE)
+        """
+        新增交易
+        交易是損益紀錄，批次外立即寫入，不進計時緩衝（SIGKILL / OOM 時計時器與 atexit
+        都不會執行）；批次內與持倉變更在區塊結束時一起寫入
+        """
         trade = {
-            "id": f"{symbol}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+            "id": self._make_id(symbol),
             "symbol": symbol,
             "trade_type": trade_type,
             "entry_price": entry_price,
@@ -211,22 +661,96 @@ class JsonManager:
             "quantity": quantity,
             "pnl_pct": pnl_pct,
             "reason": reason,
-            "created_at": datetime.now().isoformat()
+            "created_at": datetime.now().isoformat(),
+            "_ts": time.time_ns()
         }
-        trades.append(trade)
-        self._write_json(TRADES_FILE, trades)
+        self._insert_buf[TRADES_FILE].append(trade)
+        if not self._batch_depth:
+            self._flush_inserts(TRADES_FILE)
         return trade
     
-    def get_trades(self, symbol=None, limit=50):
-        """取得交易紀錄"""
-        trades = self._read_json(TRADES_FILE)
+    @_synchronized
+    def get_trades(self, symbol=None, limit=50, fields=None):
+        """取得交易紀錄（fields: 只回傳的欄位）"""
+        ordered, by_symbol = self._trade_index()
+        pending = self._insert_buf[TRADES_FILE]
         if symbol:
-            trades = [t for t in trades if t.get("symbol") == symbol]
-        return sorted(trades, key=lambda x: x.get("created_at", ""), reverse=True)[:limit]
+            ordered = by_symbol.get(symbol, [])
+            pending = [t for t in pending if t.get("symbol") == symbol]
+        # 檔案中的前 limit 筆已排序，只需與尚未寫入的緩衝合併
+        return self._project(self._latest(ordered[:limit] + pending, limit, "created_at"), fields)
+    
+    def _trade_index(self):
+        """
+        依時間排序的交易索引（新到舊），交易檔內容改變時重建
+        交易大多依時間附加，排序接近線性；呼叫端須持有 _lock
+        """
+        base = self._read_json(TRADES_FILE)
+        if base is not self._trade_order[0]:
+            ordered = sorted(base, key=lambda x: (x.get("_ts", 0), x.get("created_at", "")), reverse=True)
+            by_symbol = {}
+            for t in ordered:
+                by_symbol.setdefault(t.get("symbol"), []).append(t)
+            self._trade_order = (base, ordered, by_symbol)
+        return self._trade_order[1], self._trade_order[2]
     
+    TRADE_STATS_LIMIT = 1000
+    
+    @staticmethod
+    def _count_trade(stats, trade):
+        pnl = trade.get("pnl_pct", 0)
+        for key in (None, trade.get("symbol")):
+            c = stats.get(key)
+            if c is None:
+                stats[key] = [1, int(pnl > 0), pnl, pnl, pnl]
+            else:
+                c[0] += 1
+                c[1] += pnl > 0
+                c[2] += pnl
+                c[3] = max(c[3], pnl)
+                c[4] = min(c[4], pnl)
+    
+    def _trade_counters(self):
+        """
+        交易統計累計值；交易檔內容改變（外部寫入）時重建，新增的交易逐筆累加
+        """
+        with self._lock:
+            base = self._read_json(TRADES_FILE)
+            if base is not self._trade_stats_base:
+                self._trade_stats = {}
+                for trade in base:
+                    self._count_trade(self._trade_stats, trade)
+                self._trade_stats_base = base
+                self._trade_stats_pending = 0
+            buf = self._insert_buf[TRADES_FILE]
+            for trade in buf[self._trade_stats_pending:]:
+                self._count_trade(self._trade_stats, trade)
+            self._trade_stats_pending = len(buf)
+            return self._trade_stats
+    
+    @_synchronized
     def get_trade_stats(self, symbol=None):
-        """取得交易統計"""
-        trades = self.get_trades(symbol=symbol, limit=1000)
+        """取得交易統計（最近 1000 筆）"""
+        c = self._trade_counters().get(symbol or None)
+        if c is not None and c[0] <= self.TRADE_STATS_LIMIT:
+            total, wins, pnl_sum, pnl_max, pnl_min = c
+            return {
+                "total_trades": total,
+                "winning_trades": wins,
+                "losing_trades": total - wins,
+                "win_rate": wins / total * 100,
+                "avg_pnl": float(pnl_sum / total),
+                "max_pnl": float(pnl_max),
+                "min_pnl": float(pnl_min)
+            }
+        
+        # 沒有交易，或超過上限時只統計最近的紀錄
+        trades = self._buffered_records(TRADES_FILE)
+        if symbol:
+            trades = [t for t in trades if t.get("symbol") == symbol]
+        # 統計與順序無關，超過上限時才需要挑出最近的紀錄
+        if len(trades) > self.TRADE_STATS_LIMIT:
+            trades = self._latest(trades, self.TRADE_STATS_LIMIT, "created_at")
         
         if not trades:
             return {
@@ -239,70 +763,139 @@ class JsonManager:
                 "min_pnl": 0
             }
         
-        winning = [t for t in trades if t.get("pnl_pct", 0) > 0]
-        losing = [t for t in trades if t.get("pnl_pct", 0) <= 0]
-        
-        pnls = [t.get("pnl_pct", 0) for t in trades]
+        pnls = np.fromiter((t.get("pnl_pct", 0) for t in trades), dtype=np.float64, count=len(trades))
+        total = pnls.size
+        wins = int((pnls > 0).sum())
         
         return {
-            "total_trades": len(trades),
-            "winning_trades": len(winning),
-            "losing_trades": len(losing),
-            "win_rate": len(winning) / len(trades) * 100 if trades else 0,
-            "avg_pnl": sum(pnls) / len(pnls) if pnls else 0,
-            "max_pnl": max(pnls) if pnls else 0,
-            "min_pnl": min(pnls) if pnls else 0
+            "total_trades": total,
+            "winning_trades": wins,
+            "losing_trades": total - wins,
+            "win_rate": wins / total * 100,
+            "avg_pnl": float(pnls.mean()),
+            "max_pnl": float(pnls.max()),
+            "min_pnl": float(pnls.min())
         }
     
     # ============ 訊號紀錄 ============
     
     def log_signal(self, symbol, signal_type, data):
         """記錄訊號"""
-        signals = self._read_json(SIGNALS_FILE)
         signal = {
             "symbol": symbol,
             "signal_type": signal_type,
             "data": data,
-            "created_at": datetime.now().isoformat()
+            "created_at": datetime.now().isoformat(),
+            "_ts": time.time_ns()
         }
-        signals.append(signal)
-        self._write_json(SIGNALS_FILE, signals)
+        self._buffer_insert(SIGNALS_FILE, signal)
         return signal
     
-    def get_signals(self, symbol=None, signal_type=None, limit=100):
-        """取得訊號"""
-        signals = self._read_json(SIGNALS_FILE)
+    @_synchronized
+    def get_signals(self, symbol=None, signal_type=None, limit=100, fields=None):
+        """取得訊號（fields: 只回傳的欄位）"""
+        signals = self._buffered_records(SIGNALS_FILE)
         if symbol:
             signals = [s for s in signals if s.get("symbol") == symbol]
         if signal_type:
             signals = [s for s in signals if s.get("signal_type") == signal_type]
-        return sorted(signals, key=lambda x: x.get("created_at", ""), reverse=True)[:limit]
+        return self._project(self._latest(signals, limit, "created_at"), fields)
     
     # ============ 系統日誌 ============
     
+    # 日誌檔保留筆數，每寫入 LOG_ROTATE_EVERY 筆裁切一次
+    LOG_KEEP = 500
+    LOG_ROTATE_EVERY = 1000
+    
     def log(self, level, message, module="general"):
-        """記錄日誌"""
-        logs = self._read_json(LOGS_FILE)
+        """記錄日誌（附加一行，不讀取整個檔案；先進緩衝再批次寫入）"""
         log_entry = {
             "level": level,
             "message": message,
             "module": module,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            "_ts": time.time_ns()
         }
-        logs.append(log_entry)
-        
-        # 只保留最近 500 筆
-        if len(logs) > 500:
-            logs = logs[-500:]
+        line = orjson.dumps(log_entry, option=self._ORJSON_OPTIONS, default=str) + b'\n'
+        with self._lock:
+            self._log_buf.append(line)
+            self._schedule_flush()
+    
+    def _append_logs(self, lines):
+        try:
+            with open(LOGS_FILE, 'ab') as f:
+                f.write(b''.join(lines))
+        except Exception as e:
+            print(f"警告: 無法寫入 {LOGS_FILE} ({e})")
+            return
         
-        self._write_json(LOGS_FILE, logs)
+        self._log_writes += len(lines)
+        if self._rotate_log_file and self._log_writes >= self.LOG_ROTATE_EVERY:
+            self._rotate_logs()
+    
+    def start_log_rotation(self):
+        """
+        由交易機器人程序呼叫：轉換舊格式並裁切日誌檔，之後每 LOG_ROTATE_EVERY 筆裁切一次
+        Dashboard 程序也開啟同一個 logs.jsonl；裁切以暫存檔 + os.replace 改寫整個檔案，
+        只能由寫入日誌的單一程序執行，否則另一個程序讀取後附加的日誌會被覆蓋
+        """
+        with self._lock:
+            self._rotate_log_file = True
+            self._migrate_legacy_logs()
+            self._rotate_logs()
+    
+    def _rotate_logs(self):
+        """只保留最近 LOG_KEEP 筆日誌"""
+        self._log_writes = 0
+        try:
+            with open(LOGS_FILE, 'rb') as f:
+                lines = deque(f, maxlen=self.LOG_KEEP + 1)
+            if len(lines) <= self.LOG_KEEP:
+                return
+            lines.popleft()
+            self._atomic_write(LOGS_FILE, b''.join(lines), fsync=False)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"警告: 無法裁切 {LOGS_FILE} ({e})")
     
-    def get_logs(self, level=None, limit=100):
-        """取得日誌"""
-        logs = self._read_json(LOGS_FILE)
+    def _migrate_legacy_logs(self):
+        """將舊的 logs.json（JSON 陣列）轉為 JSON Lines"""
+        legacy = os.path.splitext(LOGS_FILE)[0] + ".json"
+        if not os.path.exists(legacy) or os.path.exists(LOGS_FILE):
+            return
+        try:
+            logs = self._read_json(legacy)
+            with open(LOGS_FILE, 'wb') as f:
+                for entry in logs[-self.LOG_KEEP:]:
+                    f.write(orjson.dumps(entry, option=self._ORJSON_OPTIONS, default=str) + b'\n')
+            os.remove(legacy)
+        except Exception as e:
+            print(f"警告: 無法轉換 {legacy} ({e})")
+    
+    def get_logs(self, level=None, limit=100, fields=None):
+        """取得日誌（fields: 只回傳的欄位）"""
+        try:
+            with open(LOGS_FILE, 'rb') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        with self._lock:
+            lines += self._log_buf
+        
+        # 檔案依時間附加；不篩選等級時只需解析最後 limit 行
+        if not level:
+            lines = lines[-limit:]
+        
+        logs = []
+        for line in lines:
+            try:
+                logs.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                continue  # 寫入中斷留下的不完整行
         if level:
             logs = [l for l in logs if l.get("level") == level]
-        return sorted(logs, key=lambda x: x.get("timestamp", ""), reverse=True)[:limit]
+        return self._project(self._latest(logs, limit, "timestamp"), fields)
     
     # ============ 策略配置 ============
     
@@ -312,7 +905,7 @@ class JsonManager:
             "params": params,
             "updated_at": datetime.now().isoformat()
         }
-        self._write_json(CONFIG_FILE, config)
+        self._write_json(CONFIG_FILE, config, pretty=True)
     
     def get_strategy_params(self):
         """取得策略參數"""
@@ -326,15 +919,15 @@ class JsonManager:
     
     # ============ 忽略訊號開關 ============
     
+    @_synchronized
     def set_ignore_signals(self, ignore: bool):
         """設定是否忽略買入/賣出訊號"""
         try:
             config = self._read_json(CONFIG_FILE)
-            if not isinstance(config, dict):
-                config = {}
+            config = dict(config) if isinstance(config, dict) else {}
             config["ignore_signals"] = ignore
             config["ignore_updated_at"] = datetime.now().isoformat()
-            self._write_json(CONFIG_FILE, config)
+            self._write_json(CONFIG_FILE, config, pretty=True)
             return True
         except Exception as e:
             print(f"設定 ignore_signals 失敗: {e}")
@@ -350,6 +943,19 @@ class JsonManager:
         except:
             return False
     
+    # ============ Dashboard API ============
+    
+    # 共用連線（keep-alive），避免每次查詢重新建立 TCP / TLS 連線
+    _http = None
+    
+    @classmethod
+    def _dashboard_session(cls):
+        """取得 Dashboard API 共用的 requests.Session"""
+        if cls._http is None:
+            import requests
+            cls._http = requests.Session()
+        return cls._http
+    
     # ============ 個別股票策略配置 ============
     
     # 使用內存存儲參數（Railway filesystem 唯讀）
@@ -376,8 +982,7 @@ class JsonManager:
             # 優先從 Dashboard API 獲取
             from config import DASHBOARD_URL
             try:
-                import requests
-                response = requests.get(
+                response = self._dashboard_session().get(
                     f"{DASHBOARD_URL}/api/symbol_params/{symbol}",
                     timeout=5
                 )
@@ -410,8 +1015,7 @@ class JsonManager:
             # 優先從 Dashboard API 獲取
             from config import DASHBOARD_URL
             try:
-                import requests
-                response = requests.get(
+                response = self._dashboard_session().get(
                     f"{DASHBOARD_URL}/api/symbol_params",
                     timeout=5
                 )
@@ -446,8 +1050,7 @@ class JsonManager:
             # 優先從 Dashboard API 獲取
             from config import DASHBOARD_URL
             try:
-                import requests
-                response = requests.get(
+                response = self._dashboard_session().get(
                     f"{DASHBOARD_URL}/api/symbols",
                     timeout=5
                 )
@@ -467,7 +1070,7 @@ class JsonManager:
     
     def add_monitor_symbol(self, symbol):
         """新增監控股票"""
-        symbols = self.get_monitor_symbols()
+        symbols = list(self.get_monitor_symbols())
         symbol = symbol.upper().strip()
         if symbol and symbol not in symbols:
             symbols.append(symbol)
@@ -477,7 +1080,7 @@ class JsonManager:
     
     def remove_monitor_symbol(self, symbol):
         """移除監控股票"""
-        symbols = self.get_monitor_symbols()
+        symbols = list(self.get_monitor_symbols())
         symbol = symbol.upper().strip()
         if symbol in symbols:
             symbols.remove(symbol)
@@ -492,5 +1095,10 @@ class JsonManager:
         return symbols
 
 
-# 取得實例
+# 取得實例（同一行程共用，快取與寫入緩衝只有一份）
 json_manager = JsonManager()
+
+
+def get_json_manager():
+    """取得共用的 JsonManager 實例"""
+    return json_manager
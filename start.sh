@@ -5,7 +5,7 @@ echo "安裝依賴..."
 pip install -q -r requirements.txt
 
 echo "啟動 Web Dashboard..."
-python dashboard/app.py &
+python dashboard/run.py &
 DASHBOARD_PID=$!
 
 echo "啟動交易機器人..."
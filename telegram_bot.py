@@ -1,26 +1,105 @@
 """
 Telegram 機器人模組
 """
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, LinkPreviewOptions
+from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, Defaults, filters
 import asyncio
-from datetime import datetime
+import functools
+import secrets
+import signal
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 from json_manager import JsonManager
-from config import TradingState
+from config import TradingState, TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_PORT, TELEGRAM_WEBHOOK_SECRET
 import logging
 
 logger = logging.getLogger(__name__)
 
+# /status 顯示的狀態名稱
+_STATUS_NAMES = {
+    TradingState.SIGNAL_BUY_SENT: "待買入確認",
+    TradingState.HOLDING: "持有中",
+    TradingState.SIGNAL_SELL_SENT: "待賣出確認"
+}
+
+# /start 與 /help 的固定回覆
+_START_TEXT = (
+    "🤖 股票交易機器人已啟動！\n\n"
+    "可用指令：\n"
+    "/buy [股票代碼] - 確認買入（例：/buy 2330.TW）\n"
+    "/sell [股票代碼] - 確認賣出（例：/sell 2330.TW）\n"
+    "/scan - 手動掃描監控股票\n"
+    "/status - 查看狀態\n"
+    "/positions - 查看持倉\n"
+    "/trades - 查看交易紀錄\n"
+    "/help - 說明"
+)
+
+_HELP_TEXT = """
+🤖 股票交易機器人說明
+
+📌 指令列表：
+/buy [股票代碼] - 確認買入（例：/buy 2330.TW）
+/sell [股票代碼] - 確認賣出（例：/sell 2330.TW）
+/scan - 手動掃描監控股票
+/config [股票代碼] - 查看參數（例：/config 2330.TW）
+/status - 查看目前狀態
+/positions - 查看持倉
+/trades - 查看交易紀錄
+/ignore [on/off] - 忽略訊號開關
+/help - 說明
+
+📋 買賣流程：
+1. 輸入 /scan 手動掃描 或 等待自動掃描
+2. 機器人偵測到買入訊號 → 發送通知
+3. 您輸入 /buy <股票代碼> → 機器人記錄買入資訊
+4. 機器人持續監控
+5. 機器人偵測到賣出訊號 → 發送通知
+6. 您輸入 /sell <股票代碼> → 機器人計算損益並結清
+
+⚠️ 注意：監控多檔股票時，買入/賣出必須指定股票代碼
+"""
+
+
+def _stop_loss(price, atr):
+    """建議停損價：買入價減 2 倍 ATR；沒有 ATR 時取買入價的 95%"""
+    return price - (atr * 2) if atr else price * 0.95
+
+
+@functools.lru_cache(maxsize=256)
+def _buy_markup(symbol):
+    """買入確認訊息的按鈕，依股票代碼快取（PTB 的 TelegramObject 不可變，可共用）"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("📊 查看持倉", callback_data=f"position_{symbol}")]
+    ])
+
 
 class TradingBot:
     """交易機器人類"""
     
+    PRICE_CACHE_TTL = 30  # 秒，掃描迴圈取得的價格在此時間內直接使用
+    POSITION_CACHE_TTL = 2.0  # 秒，連續指令（/status 後接 /positions）共用查詢結果
+    POLL_TIMEOUT = 30  # 秒，長輪詢等待時間，閒置時減少 getUpdates 次數
+    # 只接收指令訊息與按鈕回呼；重啟時丟棄停機期間累積的更新（過期的 /buy /sell 不再處理）
+    UPDATE_OPTIONS = {"allowed_updates": [Update.MESSAGE, Update.CALLBACK_QUERY], "drop_pending_updates": True}
+    SEND_RATE_LIMIT = 30  # 每秒最多發送則數（Telegram 全域限制），超過時排隊等待
+    
     def __init__(self, token, chat_id, db: JsonManager):
         self.token = token
         self.chat_id = chat_id
         self.db = db
-        
-        self.application = Application.builder().token(token).build()
+        self._price_cache = {}  # symbol -> (價格, 取得時間)
+        self._pos_cache = {}  # 查詢鍵 -> (到期時間, 結果)
+        self.scanner = None  # 建立本實例的 StockTradingBot，/scan 共用
+        self._send_times = deque(maxlen=self.SEND_RATE_LIMIT)  # 最近幾則訊息的發送時間
+        self._symbol_locks = {}  # symbol -> [asyncio.Lock, 使用中的指令數]，同一檔股票的 /buy /sell 依序處理
+        self._scan_lock = asyncio.Lock()  # 排程掃描與 /scan 不同時執行（共用 StockTradingBot 的暫存通知）
+        self._stop_event = asyncio.Event()  # run_async 等待此事件，閒置時不喚醒事件迴圈
+        
+        # 所有訊息皆為純文字：不指定 parse_mode，並關閉連結預覽
+        defaults = Defaults(parse_mode=None, link_preview_options=LinkPreviewOptions(is_disabled=True))
+        self.application = Application.builder().token(token).defaults(defaults).build()
         self._register_handlers()
     
     def _register_handlers(self):
@@ -37,17 +116,7 @@ class TradingBot:
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.unknown))
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text(
-            "🤖 股票交易機器人已啟動！\n\n"
-            "可用指令：\n"
-            "/buy [股票代碼] - 確認買入（例：/buy 2330.TW）\n"
-            "/sell [股票代碼] - 確認賣出（例：/sell 2330.TW）\n"
-            "/scan - 手動掃描監控股票\n"
-            "/status - 查看狀態\n"
-            "/positions - 查看持倉\n"
-            "/trades - 查看交易紀錄\n"
-            "/help - 說明"
-        )
+        await update.message.reply_text(_START_TEXT)
     
     async def buy(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         args = context.args
@@ -62,39 +131,34 @@ class TradingBot:
         
         symbol = args[0].upper()
         
-        position = self.db.get_position(symbol)
-        
-        if not position:
-            await update.message.reply_text(f"❌ 沒有 {symbol} 的買入訊號\n\n請確認股票是否在監控清單中")
-            return
-        
-        if position["status"] == TradingState.HOLDING:
-            await update.message.reply_text(f"⚠️ {symbol} 已經在持倉中")
-            return
-        
-        if position["status"] != TradingState.SIGNAL_BUY_SENT:
-            await update.message.reply_text(f"⚠️ {symbol} 目前沒有買入訊號")
-            return
-        
-        signal_data = position.get("signal_data", {})
-        entry_price = signal_data.get("price")
-        entry_time = signal_data.get("time")
-        indicators = position.get("indicators", {})
-        atr = indicators.get("atr")
-        
-        stop_loss = entry_price - (atr * 2) if atr else entry_price * 0.95
-        
-        self.db.add_holding_info(
-            symbol=symbol, entry_price=entry_price, entry_time=entry_time,
-            stop_loss=round(stop_loss, 2), quantity=0
-        )
-        
-        self.db.add_trade(symbol, "buy", entry_price, 0, 0, 0, "使用者確認買入")
-        
-        keyboard = [
-            [InlineKeyboardButton("📊 查看持倉", callback_data=f"position_{symbol}")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        async with self._lock(symbol):
+            position = await self._cached_position(symbol)
+            
+            if not position:
+                await update.message.reply_text(f"❌ 沒有 {symbol} 的買入訊號\n\n請確認股票是否在監控清單中")
+                return
+            
+            if position["status"] == TradingState.HOLDING:
+                await update.message.reply_text(f"⚠️ {symbol} 已經在持倉中")
+                return
+            
+            if position["status"] != TradingState.SIGNAL_BUY_SENT:
+                await update.message.reply_text(f"⚠️ {symbol} 目前沒有買入訊號")
+                return
+            
+            signal_data = position.get("signal_data", {})
+            entry_price = signal_data.get("price")
+            entry_time = signal_data.get("time")
+            indicators = position.get("indicators", {})
+            
+            stop_loss = _stop_loss(entry_price, indicators.get("atr"))
+            
+            await self._m(
+                self.db.confirm_buy, symbol=symbol, entry_price=entry_price, entry_time=entry_time,
+                stop_loss=round(stop_loss, 2), quantity=0, reason="使用者確認買入",
+                log_message=f"使用者確認買入 {symbol} @ {entry_price}", module="telegram_bot"
+            )
+            self.invalidate_position_cache()
         
         await update.message.reply_text(
             f"✅ 買入確認成功！\n\n"
@@ -102,10 +166,8 @@ class TradingBot:
             f"💰 買入價格：{entry_price}\n"
             f"⏰ 買入時間：{entry_time}\n"
             f"🛡️ 停損價：{stop_loss:.2f}",
-            reply_markup=reply_markup
+            reply_markup=_buy_markup(symbol)
         )
-        
-        self.db.log("INFO", f"使用者確認買入 {symbol} @ {entry_price}", "telegram_bot")
     
     async def sell(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         args = context.args
@@ -120,38 +182,36 @@ class TradingBot:
         
         symbol = args[0].upper()
         
-        position = self.db.get_position(symbol)
-        
-        if not position:
-            await update.message.reply_text(f"❌ 沒有 {symbol} 的持倉記錄\n\n請確認股票是否在持倉中")
-            return
-        
-        if position["status"] not in [TradingState.HOLDING, TradingState.SIGNAL_SELL_SENT]:
-            await update.message.reply_text(f"⚠️ {symbol} 目前沒有持倉")
-            return
-        
-        holding = position.get("holding_info", {})
-        entry_price = holding.get("entry_price")
-        entry_time = holding.get("entry_time")
-        quantity = holding.get("quantity", 0)
-        
-        # 取得目前股價
-        try:
-            import yfinance as yf
-            stock = yf.Ticker(symbol)
-            current_price = stock.history(period="1d")['Close'].iloc[-1]
-        except:
-            current_price = entry_price  # 如果取得失敗，使用買入價
-        
-        pnl_pct = (current_price - entry_price) / entry_price * 100 if entry_price and entry_price > 0 else 0
-        pnl_symbol = "+" if pnl_pct >= 0 else ""
-        pnl_emoji = "🟢" if pnl_pct >= 0 else "🔴"
-        
-        exit_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.db.close_position(symbol, current_price, exit_time, pnl_pct, "manual")
-        self.db.set_cooldown(symbol, datetime.now().isoformat())
-        self.db.add_trade(symbol, "sell", entry_price, current_price, quantity, pnl_pct, "使用者確認賣出")
-        self.db.delete_position(symbol)
+        async with self._lock(symbol):
+            position = await self._cached_position(symbol)
+            
+            if not position:
+                await update.message.reply_text(f"❌ 沒有 {symbol} 的持倉記錄\n\n請確認股票是否在持倉中")
+                return
+            
+            if position["status"] not in [TradingState.HOLDING, TradingState.SIGNAL_SELL_SENT]:
+                await update.message.reply_text(f"⚠️ {symbol} 目前沒有持倉")
+                return
+            
+            holding = position.get("holding_info", {})
+            entry_price = holding.get("entry_price")
+            entry_time = holding.get("entry_time")
+            quantity = holding.get("quantity", 0)
+            
+            # 取得目前股價（如果取得失敗，使用買入價）
+            current_price = await self._current_price(symbol, entry_price)
+            
+            pnl_pct = (current_price - entry_price) / entry_price * 100 if entry_price and entry_price > 0 else 0
+            pnl_symbol = "+" if pnl_pct >= 0 else ""
+            pnl_emoji = "🟢" if pnl_pct >= 0 else "🔴"
+            
+            exit_time = time.strftime("%Y-%m-%d %H:%M:%S")
+            await self._m(
+                self.db.confirm_sell, symbol, entry_price, current_price, quantity, pnl_pct, reason="使用者確認賣出",
+                log_message=f"使用者確認賣出 {symbol} @ {current_price} (P&L: {pnl_pct:.2f}%)",
+                module="telegram_bot"
+            )
+            self.invalidate_position_cache()
         
         await update.message.reply_text(
             f"✅ 賣出確認成功！\n\n"
@@ -161,98 +221,96 @@ class TradingBot:
             f"⏰ 賣出時間：{exit_time}\n\n"
             f"{pnl_emoji} 損益：{pnl_symbol}{pnl_pct:.2f}%"
         )
-        
-        self.db.log("INFO", f"使用者確認賣出 {symbol} @ {current_price} (P&L: {pnl_pct:.2f}%)", "telegram_bot")
     
     async def status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        positions = self.db.get_all_positions()
-        cooldown = self.db.get_cooldown_symbols()
+        bundle = await self._current_positions()
+        positions = bundle["positions"]
+        cooldown = bundle["cooldown"]
         
-        text = "📊 目前狀態\n\n"
+        # 逐段收集後一次 join，避免字串重複複製
+        parts = ["📊 目前狀態\n\n"]
         
         if positions:
-            text += "📈 持倉中：\n"
+            parts.append("📈 持倉中：\n")
             for p in positions:
-                holding = p.get("holding_info", {})
                 status = p["status"]
-                status_name = {
-                    TradingState.SIGNAL_BUY_SENT: "待買入確認",
-                    TradingState.HOLDING: "持有中",
-                    TradingState.SIGNAL_SELL_SENT: "待賣出確認"
-                }.get(status, status)
+                status_name = _STATUS_NAMES.get(status, status)
                 
-                entry_price = holding.get("entry_price", "N/A")
-                stop_loss = holding.get("stop_loss", "N/A")
+                entry_price = p.get("entry_price", "N/A")
+                stop_loss = p.get("stop_loss", "N/A")
                 
-                text += f"- {p['symbol']}: {status_name}\n"
+                parts.append(f"- {p['symbol']}: {status_name}\n")
                 if entry_price != "N/A":
-                    text += f"  買入價: {entry_price}, 停損: {stop_loss}\n"
+                    parts.append(f"  買入價: {entry_price}, 停損: {stop_loss}\n")
         else:
-            text += "📭 無持倉\n"
+            parts.append("📭 無持倉\n")
         
         if cooldown:
-            text += "\n⏳ 冷卻中：\n"
-            for c in cooldown:
-                text += f"- {c['symbol']}\n"
+            parts.append("\n⏳ 冷卻中：\n")
+            parts.extend(f"- {c['symbol']}\n" for c in cooldown)
         else:
-            text += "\n✅ 無冷卻股票"
+            parts.append("\n✅ 無冷卻股票")
         
-        await update.message.reply_text(text)
+        await update.message.reply_text("".join(parts))
     
     async def positions(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        positions = self.db.get_all_positions()
+        positions = (await self._current_positions())["positions"]
         
         if not positions:
             await update.message.reply_text("📭 目前沒有持倉")
             return
         
-        text = "📈 目前持倉：\n\n"
+        parts = ["📈 目前持倉：\n\n"]
         for p in positions:
-            holding = p.get("holding_info", {})
-            text += f"📊 {p['symbol']}\n"
-            text += f"  狀態: {p['status']}\n"
-            if holding.get("entry_price"):
-                text += f"  買入價: {holding['entry_price']}\n"
-            if holding.get("stop_loss"):
-                text += f"  停損價: {holding['stop_loss']}\n"
-            text += "\n"
-        
-        await update.message.reply_text(text)
+            parts.append(f"📊 {p['symbol']}\n  狀態: {p['status']}\n")
+            if p.get("entry_price"):
+                parts.append(f"  買入價: {p['entry_price']}\n")
+            if p.get("stop_loss"):
+                parts.append(f"  停損價: {p['stop_loss']}\n")
+            parts.append("\n")
+        
+        await update.message.reply_text("".join(parts))
     
     async def trades(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        trades = self.db.get_trades(limit=20)
+        trades = await self._m(
+            self.db.get_trades, limit=20, fields=("symbol", "trade_type", "entry_price", "exit_price", "pnl_pct")
+        )
         
         if not trades:
             await update.message.reply_text("📭 尚無交易紀錄")
             return
         
-        text = "📜 交易紀錄：\n\n"
+        parts = ["📜 交易紀錄：\n\n"]
         for t in trades:
             pnl_pct = t.get("pnl_pct", 0)
             pnl_emoji = "🟢" if pnl_pct >= 0 else "🔴"
             
-            text += f"{pnl_emoji} {t['symbol']} - {t['trade_type'].upper()}\n"
-            text += f"  買入: {t.get('entry_price', 'N/A')}"
+            parts.append(f"{pnl_emoji} {t['symbol']} - {t['trade_type'].upper()}\n")
+            parts.append(f"  買入: {t.get('entry_price', 'N/A')}")
             if t.get('exit_price'):
-                text += f" → 賣出: {t['exit_price']}\n"
+                parts.append(f" → 賣出: {t['exit_price']}\n")
             else:
-                text += "\n"
-            text += f"  損益: {pnl_pct:+.2f}%\n\n"
+                parts.append("\n")
+            parts.append(f"  損益: {pnl_pct:+.2f}%\n\n")
         
-        await update.message.reply_text(text)
+        await update.message.reply_text("".join(parts))
     
     async def scan(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """手動掃描監控股票"""
         await update.message.reply_text("🔍 開始掃描監控股票...")
         
-        # 呼叫 bot 的掃描功能
+        # 呼叫 bot 的掃描功能（共用既有的機器人實例，在執行緒中掃描以免阻塞事件迴圈）
         try:
-            from bot import StockTradingBot
-            scan_bot = StockTradingBot()
-            scan_bot.run_market_scan()
+            scan_bot = self.scanner
+            if scan_bot is None:
+                from bot import StockTradingBot
+                scan_bot = self.scanner = StockTradingBot()
+            await self._run_scanner(scan_bot.run_market_scan, False)
             
             # 檢查是否有新的買入訊號
-            positions = self.db.get_all_positions(status=TradingState.SIGNAL_BUY_SENT)
+            positions = await self._cached_positions(
+                status=TradingState.SIGNAL_BUY_SENT, fields=("symbol", "signal_data.price")
+            )
             
             if positions:
                 msg = "📈 發現買入訊號：\n\n"
@@ -281,8 +339,13 @@ class TradingBot:
         
         symbol = args[0].upper()
         
+        # 監控清單與個別參數都會查詢 Dashboard API：在執行緒中同時查詢，不阻塞事件迴圈
+        monitor_symbols, symbol_params = await asyncio.gather(
+            self._m(self.db.get_monitor_symbols),
+            self._m(self.db.get_symbol_params, symbol)
+        )
+        
         # 檢查股票是否在監控清單內
-        monitor_symbols = self.db.get_monitor_symbols()
         if symbol not in monitor_symbols:
             await update.message.reply_text(
                 f"❌ **{symbol}** 不在監控清單中\n\n"
@@ -291,9 +354,6 @@ class TradingBot:
             )
             return
         
-        # 取得個別股票參數
-        symbol_params = self.db.get_symbol_params(symbol)
-        
         if symbol_params:
             p = symbol_params
             msg = f"⚙️ **{symbol} 參數設定**\n\n"
@@ -320,25 +380,26 @@ class TradingBot:
     async def ignore(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """忽略買入/賣出訊號開關"""
         args = context.args
+        choice = args[0].lower() if args else None
         
-        if args and args[0].lower() in ["on", "yes", "true", "1"]:
+        if choice in ("on", "yes", "true", "1"):
             # 開啟忽略
-            self.db.set_ignore_signals(True)
+            await self._m(self.db.set_ignore_signals, True)
             await update.message.reply_text(
                 "🔇 **忽略模式已開啟**\n\n"
                 "機器人將不會發送買入/賣出訊號通知。\n"
                 "使用 /ignore off 可恢復通知。"
             )
-        elif args and args[0].lower() in ["off", "no", "false", "0"]:
+        elif choice in ("off", "no", "false", "0"):
             # 關閉忽略
-            self.db.set_ignore_signals(False)
+            await self._m(self.db.set_ignore_signals, False)
             await update.message.reply_text(
                 "🔔 **忽略模式已關閉**\n\n"
                 "機器人將會正常發送買入/賣出訊號通知。"
             )
         else:
             # 顯示目前狀態
-            is_ignoring = self.db.get_ignore_signals()
+            is_ignoring = await self._m(self.db.get_ignore_signals)
             status = "🔇 **忽略模式：開啟**" if is_ignoring else "🔔 **忽略模式：關閉**"
             await update.message.reply_text(
                 f"{status}\n\n"
@@ -348,78 +409,225 @@ class TradingBot:
             )
     
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        help_text = """
-🤖 股票交易機器人說明
-
-📌 指令列表：
-/buy [股票代碼] - 確認買入（例：/buy 2330.TW）
-/sell [股票代碼] - 確認賣出（例：/sell 2330.TW）
-/scan - 手動掃描監控股票
-/config [股票代碼] - 查看參數（例：/config 2330.TW）
-/status - 查看目前狀態
-/positions - 查看持倉
-/trades - 查看交易紀錄
-/ignore [on/off] - 忽略訊號開關
-/help - 說明
-
-📋 買賣流程：
-1. 輸入 /scan 手動掃描 或 等待自動掃描
-2. 機器人偵測到買入訊號 → 發送通知
-3. 您輸入 /buy <股票代碼> → 機器人記錄買入資訊
-4. 機器人持續監控
-5. 機器人偵測到賣出訊號 → 發送通知
-6. 您輸入 /sell <股票代碼> → 機器人計算損益並結清
-
-⚠️ 注意：監控多檔股票時，買入/賣出必須指定股票代碼
-        """
-        await update.message.reply_text(help_text)
+        await update.message.reply_text(_HELP_TEXT)
     
     async def unknown(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❓ 未知指令，請輸入 /help 查看說明")
     
-    async def send_buy_signal(self, symbol, price, indicators):
+    # ============ 資料存取 ============
+    
+    @asynccontextmanager
+    async def _lock(self, symbol):
+        """
+        同一檔股票的確認指令鎖：讀取持倉到寫入完成之間不讓其他 /buy /sell 進入
+        （啟用 concurrent_updates 時，重複的 /buy 不會都通過狀態檢查）
+        代碼來自使用者輸入，最後一個使用者離開時移除，鎖的數量不會無限增加
+        """
+        entry = self._symbol_locks.get(symbol)
+        if entry is None:
+            entry = self._symbol_locks[symbol] = [asyncio.Lock(), 0]
+        entry[1] += 1  # 持有與等待中的指令數
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._symbol_locks[symbol]
+    
+    @staticmethod
+    async def _m(fn, *args, **kwargs):
+        """
+        在執行緒中執行資料存取（檔案讀寫 / fsync / Dashboard API），不阻塞事件迴圈
+        JsonManager 以 _lock 保護讀寫；掃描的批次區塊進行中時，確認買賣會在執行緒中
+        等到掃描寫入磁碟後才執行，回覆「成功」時資料已寫入
+        （掃描在批次外下載資料，批次只包住持倉 / 訊號更新，等待時間很短）
+        """
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    
+    async def _cached(self, key, fn, *args, **kwargs):
+        """POSITION_CACHE_TTL 秒內重複的持倉查詢直接回傳上次結果"""
+        now = time.monotonic()
+        hit = self._pos_cache.get(key)
+        if hit is not None and hit[0] > now:
+            return hit[1]
+        value = await self._m(fn, *args, **kwargs)
+        self._pos_cache[key] = (now + self.POSITION_CACHE_TTL, value)
+        return value
+    
+    async def _current_positions(self):
+        """
+        /status 與 /positions 共用的查詢：持倉摘要與冷卻清單一次取得
+        連續下兩個指令時只讀取一次（POSITION_CACHE_TTL 內）
+        """
+        return await self._cached("status", self.db.get_status_bundle)
+    
+    async def _cached_positions(self, status=None, fields=None):
+        return await self._cached(("positions", status, fields), self.db.get_all_positions,
+                                  status=status, fields=fields)
+    
+    async def _cached_position(self, symbol):
+        return await self._cached(("position", symbol), self.db.get_position, symbol)
+    
+    def invalidate_position_cache(self):
+        """持倉有變動時清除（指令寫入後、掃描結束時）"""
+        self._pos_cache.clear()
+    
+    # ============ 價格快取 ============
+    
+    def update_price(self, symbol, price):
+        """由掃描迴圈寫入最新價格"""
+        self._price_cache[symbol] = (price, time.time())
+    
+    @staticmethod
+    def _fetch_price(symbol):
+        import yfinance as yf
+        stock = yf.Ticker(symbol)
+        return stock.history(period="1d")['Close'].iloc[-1]
+    
+    async def _current_price(self, symbol, fallback):
+        """
+        取得目前股價：優先使用快取，過期時在執行緒中下載，不阻塞事件迴圈
+        """
+        price, ts = self._price_cache.get(symbol, (None, 0))
+        if price is not None and time.time() - ts < self.PRICE_CACHE_TTL:
+            return price
+        try:
+            price = await asyncio.to_thread(self._fetch_price, symbol)
+        except Exception:
+            return fallback
+        self.update_price(symbol, price)
+        return price
+    
+    # ============ 排程任務 ============
+    
+    def schedule_jobs(self, interval):
+        """
+        以 JobQueue 排程掃描 / 硬停損檢查 / 股價記錄，與指令處理共用 run() 的事件迴圈
+        未安裝 job-queue 套件（job_queue 為 None）時回傳 False，由呼叫端改用 schedule
+        """
+        job_queue = self.application.job_queue
+        if job_queue is None or self.scanner is None:
+            return False
+        job_queue.run_repeating(self._scan_job, interval=interval, name="market_scan")
+        job_queue.run_repeating(self._stop_loss_job, interval=60, name="hard_stop_loss")
+        job_queue.run_repeating(self._price_log_job, interval=interval, name="price_log")
+        return True
+    
+    async def _run_scanner(self, fn, *args):
+        """在執行緒中執行掃描函式（下載與指標計算），完成後在事件迴圈中發送回傳的通知"""
+        async with self._scan_lock:
+            messages = await asyncio.to_thread(fn, *args)
+        if messages:
+            await self.send_signals_batch(messages)
+        self.invalidate_position_cache()
+    
+    async def _scan_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self._run_scanner(self.scanner.run_market_scan, False)
+    
+    async def _stop_loss_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self._run_scanner(self.scanner.run_hard_stop_loss_check, False)
+    
+    async def _price_log_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self._run_scanner(self.scanner.log_stock_prices)
+    
+    # ============ 訊號通知 ============
+    
+    _BUY_TEMPLATE = (
+        "🟢 【買入訊號】{symbol}\n\n"
+        "💰 價格：{price}\n"
+        "🛡️ 停損：{stop_loss:.2f}\n"
+        "📊 ATR：{atr:.2f}\n"
+        "📉 RSI：{rsi:.2f}\n"
+        "📈 ADX：{adx:.2f}\n\n"
+        "請回覆 /buy {symbol} 確認買入"
+    )
+    _SELL_TEMPLATE = (
+        "🔴 【賣出訊號】{symbol}\n\n"
+        "💰 價格：{price}\n"
+        "📋 原因：{reason}{pnl_text}\n\n"
+        "請回覆 /sell {symbol} 確認賣出"
+    )
+    _FORCE_SELL_TEMPLATE = (
+        "🚨 【強制賣出通知】{symbol}\n\n"
+        "💰 價格：{price}\n"
+        "📋 原因：{reason}\n\n"
+        "已自動發送賣出訊號，請回覆 /sell {symbol} 確認"
+    )
+    
+    def format_buy_signal(self, symbol, price, indicators):
         atr = indicators.get("atr", 0)
-        rsi = indicators.get("rsi", 0)
-        adx = indicators.get("adx", 0)
-        stop_loss = price - (atr * 2) if atr else price * 0.95
-        
-        message = (
-            f"🟢 【買入訊號】{symbol}\n\n"
-            f"💰 價格：{price}\n"
-            f"🛡️ 停損：{stop_loss:.2f}\n"
-            f"📊 ATR：{atr:.2f}\n"
-            f"📉 RSI：{rsi:.2f}\n"
-            f"📈 ADX：{adx:.2f}\n\n"
-            f"請回覆 /buy {symbol} 確認買入"
-        )
-        
-        await self.application.bot.send_message(chat_id=self.chat_id, text=message)
+        stop_loss = _stop_loss(price, atr)
+        return self._BUY_TEMPLATE.format_map({
+            "symbol": symbol, "price": price, "stop_loss": stop_loss, "atr": atr,
+            "rsi": indicators.get("rsi", 0), "adx": indicators.get("adx", 0)
+        })
     
-    async def send_sell_signal(self, symbol, price, reason, pnl_pct=None):
+    def format_sell_signal(self, symbol, price, reason, pnl_pct=None):
         pnl_text = f"\n📊 目前損益：{pnl_pct:+.2f}%" if pnl_pct is not None else ""
-        
-        message = (
-            f"🔴 【賣出訊號】{symbol}\n\n"
-            f"💰 價格：{price}\n"
-            f"📋 原因：{reason}{pnl_text}\n\n"
-            f"請回覆 /sell {symbol} 確認賣出"
+        return self._SELL_TEMPLATE.format_map({
+            "symbol": symbol, "price": price, "reason": reason, "pnl_text": pnl_text
+        })
+    
+    def format_force_sell_notification(self, symbol, price, reason):
+        return self._FORCE_SELL_TEMPLATE.format_map({
+            "symbol": symbol, "price": price, "reason": reason
+        })
+    
+    async def _send(self, text):
+        """
+        發送通知到 chat_id，一秒內已發送 SEND_RATE_LIMIT 則時延後到可用時段
+        先登記時段再等待（中間沒有 await），同時發送的多則訊息不會搶同一時段
+        """
+        now = time.monotonic()
+        slot = now
+        if len(self._send_times) == self._send_times.maxlen:
+            slot = max(now, self._send_times[0] + 1.0)
+        self._send_times.append(slot)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        return await self.application.bot.send_message(chat_id=self.chat_id, text=text)
+    
+    async def send_signals_batch(self, messages):
+        """
+        同時發送多則通知（同一次掃描觸發的訊號）
+        單則失敗只記錄錯誤，不影響其他訊息
+        """
+        results = await asyncio.gather(
+            *(self._send(m) for m in messages),
+            return_exceptions=True
         )
-        
-        await self.application.bot.send_message(chat_id=self.chat_id, text=message)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Telegram 通知發送失敗: {result}")
+    
+    async def send_buy_signal(self, symbol, price, indicators):
+        message = self.format_buy_signal(symbol, price, indicators)
+        await self._send(message)
+    
+    async def send_sell_signal(self, symbol, price, reason, pnl_pct=None):
+        message = self.format_sell_signal(symbol, price, reason, pnl_pct)
+        await self._send(message)
     
     async def send_force_sell_notification(self, symbol, price, reason):
-        message = (
-            f"🚨 【強制賣出通知】{symbol}\n\n"
-            f"💰 價格：{price}\n"
-            f"📋 原因：{reason}\n\n"
-            f"已自動發送賣出訊號，請回覆 /sell {symbol} 確認"
-        )
-        
-        await self.application.bot.send_message(chat_id=self.chat_id, text=message)
+        message = self.format_force_sell_notification(symbol, price, reason)
+        await self._send(message)
     
     def run(self):
         try:
-            self.application.run_polling()
+            if TELEGRAM_WEBHOOK_URL:
+                # webhook：有更新時才由 Telegram 推送，不需持續長輪詢
+                # secret_token 驗證推送來源，知道網址也無法偽造 /buy /sell 確認
+                self.application.run_webhook(
+                    listen="0.0.0.0",
+                    port=TELEGRAM_WEBHOOK_PORT,
+                    url_path=self.token,
+                    webhook_url=f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/{self.token}",
+                    secret_token=TELEGRAM_WEBHOOK_SECRET or secrets.token_urlsafe(32),
+                    **self.UPDATE_OPTIONS
+                )
+            else:
+                self.application.run_polling(timeout=self.POLL_TIMEOUT, **self.UPDATE_OPTIONS)
         except Exception as e:
             if "Conflict" in str(e) or "terminated by other" in str(e):
                 logger.warning("⚠️ Telegram Bot 被另一個實例终止 (部署重啟中)")
@@ -429,11 +637,23 @@ class TradingBot:
     async def run_async(self):
         await self.application.initialize()
         await self.application.start()
-        await self.application.updater.start_polling()
+        await self.application.updater.start_polling(timeout=self.POLL_TIMEOUT, **self.UPDATE_OPTIONS)
+        
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows 或非主執行緒不支援，改由 stop() 結束
         
         try:
-            while True:
-                await asyncio.sleep(1)
+            await self._stop_event.wait()
         except KeyboardInterrupt:
+            pass
+        finally:  # 取消（CancelledError）時同樣關閉，並繼續向上傳遞
             await self.application.updater.stop()
             await self.application.stop()
+    
+    def stop(self):
+        """結束 run_async"""
+        self._stop_event.set()